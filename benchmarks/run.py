@@ -0,0 +1,211 @@
+"""
+Benchmark the verbalizer on the bundled ontologies and on synthetic ones, and compare the results between versions.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run data/ro.owl --synthetic 10000 100000 --limit 1000 --output results.json
+    python -m benchmarks.run --output new.json --compare results.json
+
+For every ontology the graph load time, the `Vocabulary` init time, the latency distribution of `Verbalizer.verbalize`,
+the end-to-end throughput of `Processor` and the peak RSS are measured, with the OWL patterns enabled. Each ontology
+runs in its own process, so the peak memory of one does not hide the other, and owl:imports are dropped so the results
+do not depend on the network. Run it from the root of the repository.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import multiprocessing
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from importlib import metadata
+from pathlib import Path
+
+import numpy
+import rdflib
+from rdflib import OWL
+
+from benchmarks.synthetic import write_ontology
+from verbalizer import Verbalizer
+from verbalizer.patterns import owl_disjoint, owl_first_rest, owl_restriction
+from verbalizer.process import Processor
+from verbalizer.sampler import Sampler
+from verbalizer.vocabulary import Vocabulary
+
+DATA_DIR = Path(__file__).resolve().parent.parent / 'data'
+
+# the patterns of a typical run, so the restriction, list and disjointness paths are measured as well.
+PATTERNS = [owl_disjoint.OwlDisjointWith, owl_restriction.OwlRestrictionPattern, owl_first_rest.OwlFirstRestPattern]
+
+# the metrics compared between two result files, and whether higher is better.
+METRICS = {
+    'load_s': False,
+    'vocabulary_s': False,
+    'verbalize_p50_ms': False,
+    'verbalize_p95_ms': False,
+    'verbalize_p99_ms': False,
+    'processor_entities_per_s': True,
+    'peak_rss_mb': False,
+}
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024
+
+
+def run(file_path: str, limit: int, engine: str, results):
+    start = time.perf_counter()
+    graph = Processor.from_file(file_path)
+    graph.remove((None, OWL.imports, None))
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vocabulary = Vocabulary(graph)
+    vocabulary_time = time.perf_counter() - start
+
+    # end-to-end, including the enumeration of the entities and the output files.
+    sampler = Sampler(sample_n=limit, seed=0, streaming=True) if limit else None
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        verbalizer = Verbalizer(vocabulary, patterns=PATTERNS, engine=engine)
+        rows = Processor.verbalize_with(verbalizer, namespace='benchmark', output_dir=output_dir, sampler=sampler)
+        processor_time = time.perf_counter() - start
+
+    # a fresh verbalizer, so the latencies are not measured against the caches warmed up by the processor.
+    verbalizer = Verbalizer(vocabulary, patterns=PATTERNS, engine=engine)
+    entities = itertools.chain(Processor.iter_entities(graph, OWL.Class),
+                               Processor.iter_entities(graph, OWL.NamedIndividual))
+    entities = list(dict.fromkeys(entities))[:limit or None]
+    latencies = []
+    for entity in entities:
+        start = time.perf_counter()
+        verbalizer.verbalize(entity)
+        latencies.append(time.perf_counter() - start)
+    p50, p95, p99 = numpy.percentile(latencies, [50, 95, 99]) * 1000 if latencies else (0.0, 0.0, 0.0)
+
+    results[file_path] = {
+        'triples': len(graph),
+        'entities': len(entities),
+        'load_s': load_time,
+        'vocabulary_s': vocabulary_time,
+        'verbalize_p50_ms': float(p50),
+        'verbalize_p95_ms': float(p95),
+        'verbalize_p99_ms': float(p99),
+        'verbalize_max_ms': max(latencies, default=0.0) * 1000,
+        'processor_rows': len(rows),
+        'processor_entities_per_s': len(rows) / processor_time if processor_time else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def benchmark(file_path: str, limit: int, engine: str, repeat: int) -> dict:
+    """
+    Benchmark an ontology, each repetition in a fresh process.
+    :return: The median of every metric over the repetitions.
+    """
+    runs = []
+    for _ in range(repeat):
+        results = multiprocessing.Manager().dict()
+        process = multiprocessing.Process(target=run, args=(file_path, limit, engine, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError(f'Benchmark of {file_path} failed with exit code {process.exitcode}')
+        runs.append(results[file_path])
+    return {metric: statistics.median(run[metric] for run in runs) for metric in runs[0]}
+
+
+def environment() -> dict:
+    try:
+        version = metadata.version('ontology-verbalizer')
+    except metadata.PackageNotFoundError:
+        version = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=Path(__file__).resolve().parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'version': version,
+        'commit': commit,
+        'python': platform.python_version(),
+        'rdflib': rdflib.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': multiprocessing.cpu_count(),
+        'date': datetime.datetime.now(datetime.UTC).isoformat(timespec='seconds'),
+    }
+
+
+def compare(baseline: dict, current: dict):
+    """
+    Print the change of every metric of the ontologies in both result files.
+    """
+    print(f'{"ontology":<24}{"metric":<28}{"baseline":>12}{"current":>12}{"change":>10}')
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = baseline['results'][name][metric], result[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            better = change > 0 if higher_is_better else change < 0
+            marker = '' if abs(change) < 5 else (' +' if better else ' -')
+            print(f'{name:<24}{metric:<28}{old:>12.3f}{new:>12.3f}{change:>+9.1f}%{marker}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='Ontology files. default = the bundled ontologies')
+    parser.add_argument('--synthetic', type=int, nargs='*', default=[], metavar='CLASSES',
+                        help='Sizes of synthetic ontologies to benchmark, e.g. 10000 100000 1000000.')
+    parser.add_argument('--synthetic-dir', help='Where the synthetic ontologies are kept, so they are generated once. '
+                                                'default = a temporary directory')
+    parser.add_argument('--limit', type=int, help='Number of entities to verbalize per ontology. default = all')
+    parser.add_argument('--engine', default='native', choices=Verbalizer.engines)
+    parser.add_argument('--repeat', type=int, default=1, help='Repetitions per ontology, the median is reported.')
+    parser.add_argument('--output', help='Path of the JSON file to write the results to.')
+    parser.add_argument('--compare', metavar='BASELINE', help='A results file of an earlier version to compare with.')
+    args = parser.parse_args()
+
+    files = args.files or sorted(str(path) for path in DATA_DIR.iterdir() if path.suffix in ('.owl', '.ttl'))
+    report = {
+        'environment': environment(),
+        'config': {'engine': args.engine, 'limit': args.limit, 'repeat': args.repeat},
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        synthetic_dir = Path(args.synthetic_dir or temp_dir)
+        synthetic_dir.mkdir(parents=True, exist_ok=True)
+        for classes in args.synthetic:
+            path = synthetic_dir / f'synthetic_{classes}.ttl'
+            if not path.exists():
+                with open(path, 'w', encoding='utf-8') as file:
+                    write_ontology(file, classes)
+            files.append(str(path))
+
+        for file_path in files:
+            result = benchmark(file_path, args.limit, args.engine, args.repeat)
+            report['results'][Path(file_path).stem] = result
+            print(f'{Path(file_path).stem:<24}{result["triples"]:>10.0f} triples{result["load_s"]:>8.2f}s load'
+                  f'{result["vocabulary_s"]:>8.2f}s vocabulary{result["verbalize_p50_ms"]:>8.2f}ms p50'
+                  f'{result["verbalize_p99_ms"]:>8.2f}ms p99{result["processor_entities_per_s"]:>9.1f} entities/s'
+                  f'{result["peak_rss_mb"]:>8.1f}MB', flush=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            compare(json.load(file), report)
+
+
+if __name__ == '__main__':
+    main()
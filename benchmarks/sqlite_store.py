@@ -0,0 +1,85 @@
+"""
+Compare the verbalization throughput and memory of an in-memory rdflib graph with the SQLite store.
+
+    python -m benchmarks.sqlite_store data/ro.owl --limit 500
+
+Each backend runs in its own process, so the peak memory of one does not hide the other. The owl:imports of the
+ontology are removed before it is verbalized, so a database given with --db is copied first and left as it is.
+"""
+import argparse
+import multiprocessing
+import resource
+import shutil
+import tempfile
+from pathlib import Path
+import time
+
+from rdflib import Graph, OWL
+
+from verbalizer import Verbalizer
+from verbalizer.process import Processor
+from verbalizer.store import SQLiteStore
+from verbalizer.vocabulary import Vocabulary
+
+
+def run(backend: str, file_path: str, db_path: str, limit: int, engine: str, results):
+    start = time.perf_counter()
+    if backend == 'memory':
+        graph = Processor.from_file(file_path)
+    else:
+        store = SQLiteStore(db_path)
+        if len(store) == 0:
+            store.load(file_path)
+        graph = Graph(store=store)
+    graph.remove((None, OWL.imports, None))
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    verbalizer = Verbalizer(Vocabulary(graph), engine=engine)
+    vocabulary_time = time.perf_counter() - start
+
+    entities = Processor._get_classes(graph)[:limit]
+    start = time.perf_counter()
+    for entity in entities:
+        verbalizer.verbalize(entity)
+    verbalize_time = time.perf_counter() - start
+
+    results[backend] = {
+        'load_s': load_time,
+        'vocabulary_s': vocabulary_time,
+        'entities': len(entities),
+        'entities_per_s': len(entities) / verbalize_time if verbalize_time else 0.0,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file', help='The ontology file.')
+    parser.add_argument('--limit', type=int, default=1000, help='Number of classes to verbalize.')
+    parser.add_argument('--engine', default='native', choices=Verbalizer.engines)
+    parser.add_argument('--db', help='Path of an SQLite database of the ontology, which is copied. '
+                                     'default = the ontology is loaded into a temporary database')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = f'{temp_dir}/ontology.db'
+        if args.db:
+            for suffix in ('', '-wal'):
+                if Path(args.db + suffix).exists():
+                    shutil.copyfile(args.db + suffix, db_path + suffix)
+        results = multiprocessing.Manager().dict()
+        for backend in ('memory', 'sqlite'):
+            process = multiprocessing.Process(target=run,
+                                              args=(backend, args.file, db_path, args.limit, args.engine, results))
+            process.start()
+            process.join()
+
+    print(f'{"backend":<10}{"load (s)":>12}{"vocabulary (s)":>16}{"entities":>10}{"entities/s":>12}{"peak RSS (MB)":>15}')
+    for backend, result in results.items():
+        print(f'{backend:<10}{result["load_s"]:>12.2f}{result["vocabulary_s"]:>16.2f}{result["entities"]:>10}'
+              f'{result["entities_per_s"]:>12.1f}{result["peak_rss_mb"]:>15.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Generate synthetic ontologies of any size, for scaling curves.
+
+    python -m benchmarks.synthetic 100000 synthetic_100k.ttl
+
+Every class has a label, a named superclass and nested restrictions (an existential restriction on an intersection
+that contains a universal restriction), and some classes are disjoint with a sibling. The file is written as it is
+generated, so ontologies larger than memory can be produced.
+"""
+import argparse
+import random
+from typing import TextIO
+
+PREFIXES = """@prefix : <http://example.org/synthetic#> .
+@prefix owl: <http://www.w3.org/2002/07/owl#> .
+@prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+
+"""
+
+WORDS = ('cell', 'tissue', 'organ', 'process', 'membrane', 'protein', 'domain', 'region', 'layer', 'structure',
+         'receptor', 'pathway', 'complex', 'system', 'disease', 'function', 'activity', 'component', 'segment', 'unit')
+
+
+def write_ontology(file: TextIO, n_classes: int, n_properties: int = 20, restrictions: int = 2, seed: int = 0):
+    """
+    Write a synthetic ontology in Turtle.
+    :param file: The file to write to.
+    :param n_classes: Number of classes.
+    :param n_properties: Number of object properties.
+    :param restrictions: Number of nested restrictions per class.
+    :param seed: Seed of the generator, the same seed always produces the same ontology.
+    """
+    rng = random.Random(seed)
+    file.write(PREFIXES)
+
+    for p in range(n_properties):
+        file.write(f':p{p} a owl:ObjectProperty ; rdfs:label "{rng.choice(WORDS)} of {p}" .\n')
+
+    for c in range(n_classes):
+        label = f'{rng.choice(WORDS)} {rng.choice(WORDS)} {c}'
+        statements = [f'a owl:Class', f'rdfs:label "{label}"']
+        if c:
+            statements.append(f'rdfs:subClassOf :C{rng.randrange(c)}')
+        for _ in range(restrictions if c else 0):
+            outer, inner = rng.randrange(n_properties), rng.randrange(n_properties)
+            statements.append(
+                f'rdfs:subClassOf [ a owl:Restriction ; owl:onProperty :p{outer} ; owl:someValuesFrom '
+                f'[ a owl:Class ; owl:intersectionOf ( :C{rng.randrange(c)} '
+                f'[ a owl:Restriction ; owl:onProperty :p{inner} ; owl:allValuesFrom :C{rng.randrange(c)} ] ) ] ]'
+            )
+        if c > 1 and rng.random() < 0.1:
+            statements.append(f'owl:disjointWith :C{rng.randrange(c)}')
+        file.write(f':C{c} ' + ' ;\n    '.join(statements) + ' .\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('classes', type=int, help='Number of classes.')
+    parser.add_argument('output', help='Path of the Turtle file to write.')
+    parser.add_argument('--properties', type=int, default=20, help='Number of object properties.')
+    parser.add_argument('--restrictions', type=int, default=2, help='Number of nested restrictions per class.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        write_ontology(file, args.classes, args.properties, args.restrictions, args.seed)
+
+
+if __name__ == '__main__':
+    main()
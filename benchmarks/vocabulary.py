@@ -0,0 +1,76 @@
+"""
+Compare the time to build the label maps of `Vocabulary` in a single pass over the graph with the time of the SPARQL
+queries that defined them, and with the time to load them from a label snapshot.
+
+    python -m benchmarks.vocabulary data/ro.owl --synthetic 2000
+"""
+import argparse
+import tempfile
+import time
+
+from rdflib import Graph
+from tqdm import tqdm
+
+from benchmarks.synthetic import write_ontology
+from verbalizer.process import Processor
+from verbalizer.vocabulary import Vocabulary
+
+
+def sparql_label_maps(vocabulary: Vocabulary) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Build the label maps of a vocabulary with the SPARQL queries, as `Vocabulary` did before the single pass.
+    :return: The relationship labels and the object labels.
+    """
+    relationship_labels = {}
+    for iri, label in tqdm(vocabulary.graph.query(Vocabulary.RELATIONSHIP_QUERY), desc='Querying Relationship Labels'):
+        relationship_labels[iri.toPython()] = vocabulary._relationship_label(label.toPython())
+
+    object_labels = {}
+    for iri, label in tqdm(vocabulary.graph.query(Vocabulary.OBJECTS_QUERY), desc='Querying Object Labels'):
+        iri_str = iri.toPython()
+        label_str = vocabulary._object_label(iri_str, label.toPython())
+        if label_str is not None:
+            object_labels[iri_str] = label_str
+    return relationship_labels, object_labels
+
+
+def measure(name: str, graph: Graph):
+    # the graph is left as loaded, so the snapshot is keyed by the digest of its file, as by default.
+    start = time.perf_counter()
+    vocabulary = Vocabulary(graph, load_imports=False)
+    single_pass_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sparql_label_maps(vocabulary)
+    query_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        Vocabulary(graph, cache_dir=cache_dir, load_imports=False)
+        start = time.perf_counter()
+        Vocabulary(graph, cache_dir=cache_dir, load_imports=False)
+        snapshot_time = time.perf_counter() - start
+
+    print(f'{name:<24}{len(graph):>10}{query_time:>12.2f}{single_pass_time:>14.2f}'
+          f'{query_time / single_pass_time:>10.1f}x{snapshot_time:>16.3f}', flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='Ontology files.')
+    parser.add_argument('--synthetic', type=int, nargs='*', default=[], metavar='CLASSES',
+                        help='Sizes of synthetic ontologies to compare on.')
+    args = parser.parse_args()
+
+    print(f'{"ontology":<24}{"triples":>10}{"query (s)":>12}{"single (s)":>14}{"speedup":>11}{"snapshot (s)":>16}')
+    for file_path in args.files:
+        measure(file_path, Processor.from_file(file_path))
+    for classes in args.synthetic:
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = f'{directory}/synthetic_{classes}.ttl'
+            with open(file_path, 'w', encoding='utf-8') as file:
+                write_ontology(file, classes)
+            measure(f'synthetic_{classes}', Processor.from_file(file_path))
+
+
+if __name__ == '__main__':
+    main()
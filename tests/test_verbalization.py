@@ -1,15 +1,46 @@
+import functools
+import gc
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import signal
+import tempfile
+import threading
+import time
+import tracemalloc
 import types
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
 
-from rdflib import Graph
+import pandas
+from rdflib import Graph, URIRef, RDF, OWL
 
+from verbalizer.imports import ImportResolver, clear_import_cache
+from verbalizer.incremental import PreviousRun, closure_fingerprint
+from verbalizer.index import GraphIndex
+from verbalizer.manifest import RunManifest
+from verbalizer.nlp import ParaphraseLanguageModel
+from verbalizer import process
 from verbalizer.process import Processor
 from verbalizer.sampler import Sampler
-from verbalizer.verbalizer import VerbalizationError, VerbalizationInitError
+from verbalizer.shards import merge_shards
+from verbalizer.sinks import JsonlSink, ParquetSink
+from verbalizer.snapshot import file_digest, graph_fingerprint, sniff_format
+from verbalizer.store import SQLiteStore
+from verbalizer.verbalizer import VerbalizationContext, VerbalizationError, VerbalizationInitError, VerbalizationNode
 from verbalizer.vocabulary import Vocabulary
 from verbalizer import Verbalizer
 from verbalizer.patterns import owl_disjoint, owl_restriction, owl_first_rest
 
+try:
+    import pyarrow.parquet
+except ModuleNotFoundError:
+    pyarrow = None
+
 rename_iri = {
     'http://www.w3.org/2002/07/owl#equivalentClass': 'is same as',
     'http://www.w3.org/2000/01/rdf-schema#subClassOf': 'is a type of',
@@ -30,6 +61,44 @@ ignore_iri = {
 }
 
 
+def sparql_label_maps(vocabulary: Vocabulary) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Build the label maps of a vocabulary with its reference SPARQL queries.
+    :return: The relationship labels and the object labels.
+    """
+    relationship_labels = {
+        iri.toPython(): vocabulary._relationship_label(label.toPython())
+        for iri, label in vocabulary.graph.query(Vocabulary.RELATIONSHIP_QUERY)
+    }
+    object_labels = {}
+    for iri, label in vocabulary.graph.query(Vocabulary.OBJECTS_QUERY):
+        label_str = vocabulary._object_label(iri.toPython(), label.toPython())
+        if label_str is not None:
+            object_labels[iri.toPython()] = label_str
+    return relationship_labels, object_labels
+
+
+class CountingParaphraseModel(ParaphraseLanguageModel):
+    """
+    Language model that returns the text as is, and costs 1 per call.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def pseudo_to_text(self, pseudo_text: str, extra: str = None) -> str:
+        self.calls += 1
+        return pseudo_text
+
+    @property
+    def cost(self) -> float:
+        return super().cost + self.calls
+
+    @property
+    def name(self) -> str:
+        return 'counting'
+
+
 class TestVerbalization(unittest.TestCase):
 
     def test_verbalization(self):
@@ -91,3 +160,928 @@ class TestVerbalization(unittest.TestCase):
         vocabulary = Vocabulary(ontology, ignore=ignore, rephrased=rename_iri)
         with self.assertRaises(VerbalizationInitError):
             verbalizer = Verbalizer(vocabulary, patterns=patterns)
+
+    def test_native_engine_matches_sparql(self):
+        patterns = [owl_disjoint.OwlDisjointWith, owl_restriction.OwlRestrictionPattern,
+                    owl_first_rest.OwlFirstRestPattern]
+        ontology = Processor.from_file('./data/people.ttl')
+        vocab = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)
+
+        sparql_verbalizer = Verbalizer(vocab, patterns=patterns)
+
+        for engine in ['native', 'index']:
+            verbalizer = Verbalizer(vocab, patterns=patterns, engine=engine)
+            for concept in Processor._get_classes(ontology):
+                sparql_fragment, sparql_text, _, _ = sparql_verbalizer.verbalize(concept)
+                fragment, text, _, _ = verbalizer.verbalize(concept)
+                self.assertEqual(sparql_text, text)
+                self.assertEqual(sparql_fragment, fragment)
+
+    def test_graph_index(self):
+        ontology = Processor.from_file('./data/people.ttl')
+        index = GraphIndex.from_graph(ontology)
+
+        self.assertEqual(len(ontology), len(index))
+        self.assertEqual(set(ontology), set(index.triples((None, None, None))))
+        for subject in ontology.subjects(unique=True):
+            self.assertEqual(list(ontology.predicate_objects(subject)), list(index.predicate_objects(subject)))
+
+        self.assertEqual(set(Processor._get_classes(ontology)), set(Processor._get_classes(index)))
+        self.assertEqual(set(Processor._get_individuals(ontology)), set(Processor._get_individuals(index)))
+
+    def test_vocabulary_over_index(self):
+        patterns = [owl_disjoint.OwlDisjointWith, owl_restriction.OwlRestrictionPattern,
+                    owl_first_rest.OwlFirstRestPattern]
+        ontology = Processor.from_file('./data/people.ttl')
+        expected = Processor.verbalize_with(Verbalizer(Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri),
+                                                       patterns=patterns), namespace='graph')
+
+        # the vocabulary does not hold the rdflib graph.
+        index = GraphIndex.from_graph(ontology)
+        vocab = Vocabulary(index, ignore=ignore_iri, rephrased=rename_iri)
+        self.assertIs(index, vocab.graph)
+        self.assertIs(index, vocab.index)
+        with self.assertRaises(VerbalizationInitError):
+            Verbalizer(vocab, patterns=patterns)
+
+        results = Processor.verbalize_with(Verbalizer(vocab, patterns=patterns, engine='index'), namespace='index')
+        # the entities are enumerated from the index, in another order.
+        self.assertEqual(sorted((row['root'], row['text'], row['fragment']) for row in expected),
+                         sorted((row['root'], row['text'], row['fragment']) for row in results))
+
+    def test_unknown_engine(self):
+        ontology = Processor.from_file('./data/foaf.owl')
+        vocabulary = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)
+        with self.assertRaises(VerbalizationInitError):
+            Verbalizer(vocabulary, engine='unknown')
+
+    def test_deeply_nested_blank_nodes(self):
+        # A chain of 10 nested restrictions, each one reachable only through the previous blank node.
+        restriction = ':leaf'
+        for _ in range(10):
+            restriction = f'[ a owl:Restriction ; owl:onProperty :part_of ; owl:someValuesFrom {restriction} ]'
+
+        ontology = Graph()
+        ontology.parse(data=f"""
+            @prefix : <http://example.org/> .
+            @prefix owl: <http://www.w3.org/2002/07/owl#> .
+            @prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+
+            :root a owl:Class ; rdfs:subClassOf {restriction} .
+        """, format='turtle')
+        vocab = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)
+        patterns = [owl_restriction.OwlRestrictionPattern]
+
+        _, sparql_text, _, _ = Verbalizer(vocab, patterns=patterns).verbalize('http://example.org/root')
+        _, native_text, _, _ = Verbalizer(vocab, patterns=patterns, engine='native').verbalize('http://example.org/root')
+
+        self.assertEqual(sparql_text, native_text)
+        self.assertEqual(10, sparql_text.count('at least part of some'))
+        self.assertTrue(sparql_text.endswith('a leaf.'))
+
+    def test_prefetch(self):
+        ontology = Graph()
+        ontology.parse(data="""
+            @prefix : <http://example.org/> .
+            @prefix owl: <http://www.w3.org/2002/07/owl#> .
+            @prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+
+            :root a owl:Class ;
+                rdfs:subClassOf [ a owl:Restriction ; owl:onProperty :has_part ; owl:someValuesFrom :a ] ,
+                    [ a owl:Restriction ; owl:onProperty :has_part ; owl:someValuesFrom :b ] ,
+                    [ a owl:Restriction ; owl:onProperty :has_part ; owl:someValuesFrom :c ] .
+        """, format='turtle')
+        vocab = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)
+        verbalizer = Verbalizer(vocab, patterns=[owl_restriction.OwlRestrictionPattern])
+
+        fragment, text, _, stats = verbalizer.verbalize('http://example.org/root')
+        prefetched_fragment, prefetched_text, _, prefetched_stats = verbalizer.verbalize('http://example.org/root',
+                                                                                         prefetch=True)
+
+        self.assertEqual(fragment, prefetched_fragment)
+        self.assertEqual(text, prefetched_text)
+
+        # root and 3 restrictions.
+        self.assertEqual(4, stats.graph_accesses)
+        self.assertEqual(0, stats.graph_accesses_saved)
+
+        # every node of the description is read once, and every lookup is served from memory.
+        self.assertEqual(4, prefetched_stats.graph_accesses)
+        self.assertEqual(4, prefetched_stats.prefetched_lookups)
+        self.assertEqual(0, prefetched_stats.graph_accesses_saved)
+
+        # the accesses are the calls that reach the store.
+        for engine in ('sparql', 'native'):
+            for prefetch in (False, True):
+                with mock.patch.object(ontology, 'query', wraps=ontology.query) as query, \
+                        mock.patch.object(ontology, 'predicate_objects', wraps=ontology.predicate_objects) as read:
+                    engine_stats = Verbalizer(vocab, patterns=[owl_restriction.OwlRestrictionPattern],
+                                              engine=engine).verbalize('http://example.org/root', prefetch=prefetch)[3]
+                self.assertEqual(query.call_count + read.call_count, engine_stats.graph_accesses)
+
+        # the state of a verbalization is not shared, so a verbalizer can be used from several threads.
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda prefetch: verbalizer.verbalize('http://example.org/root', prefetch=prefetch),
+                                    [False, True] * 20))
+        for (_, concurrent_text, _, concurrent_stats), prefetch in zip(results, [False, True] * 20):
+            self.assertEqual(text, concurrent_text)
+            self.assertEqual((prefetched_stats if prefetch else stats).graph_accesses, concurrent_stats.graph_accesses)
+            self.assertEqual((prefetched_stats if prefetch else stats).prefetched_lookups,
+                             concurrent_stats.prefetched_lookups)
+
+    def test_pattern_without_results_argument(self):
+        class LegacyRestrictionPattern(owl_restriction.OwlRestrictionPattern):
+            def normalize(self, node, triple_collector):
+                query = self.verbalizer.next_step_query_builder(node)
+                return super().normalize(node, triple_collector, self._graph.query(query))
+
+        ontology = Processor.from_file('./data/people.ttl')
+        vocab = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)
+        verbalizer = Verbalizer(vocab, patterns=[owl_restriction.OwlRestrictionPattern])
+        legacy_verbalizer = Verbalizer(vocab, patterns=[LegacyRestrictionPattern])
+
+        self.assertTrue(verbalizer.patterns[0].receives_results)
+        self.assertFalse(legacy_verbalizer.patterns[0].receives_results)
+
+        for concept in Processor._get_classes(ontology):
+            _, text, _, stats = verbalizer.verbalize(concept)
+            _, legacy_text, _, legacy_stats = legacy_verbalizer.verbalize(concept)
+            self.assertEqual(text, legacy_text)
+            self.assertEqual(stats.patterns_evaluated, legacy_stats.patterns_evaluated)
+
+    def test_first_rest_lists(self):
+        patterns = [owl_first_rest.OwlFirstRestPattern]
+        members = ' '.join(f':member_{i}' for i in range(200))
+        ontology = Graph()
+        ontology.parse(data=f"""
+            @prefix : <http://example.org/> .
+            @prefix owl: <http://www.w3.org/2002/07/owl#> .
+            @prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .
+
+            :long a owl:Class ; owl:equivalentClass [ owl:unionOf ( {members} ) ] .
+
+            :cyclic a owl:Class ; owl:equivalentClass [ owl:unionOf _:a ] .
+            _:a rdf:first :x ; rdf:rest _:b .
+            _:b rdf:first :y ; rdf:rest _:a .
+
+            :truncated a owl:Class ; owl:equivalentClass [ owl:unionOf _:c ] .
+            _:c rdf:first :x ; rdf:rest _:d .
+            _:d rdf:first :y .
+        """, format='turtle')
+        vocab = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)
+        verbalizer = Verbalizer(vocab, patterns=patterns)
+
+        _, text, _, stats = verbalizer.verbalize('http://example.org/long')
+        self.assertIn('a member 0, and a member 1, and', text)
+        self.assertIn('and a member 199)', text)
+        self.assertEqual(1 + 1 + 200, stats.graph_accesses)
+
+        with self.assertRaises(VerbalizationError):
+            verbalizer.verbalize('http://example.org/cyclic')
+
+        with self.assertRaises(VerbalizationError):
+            verbalizer.verbalize('http://example.org/truncated')
+
+    def test_first_rest_list_memory_is_linear(self):
+        def peak_memory(n_members: int) -> int:
+            members = ' '.join(f':member_{i}' for i in range(n_members))
+            ontology = Graph()
+            ontology.parse(data=f"""
+                @prefix : <http://example.org/> .
+                @prefix owl: <http://www.w3.org/2002/07/owl#> .
+
+                :long owl:unionOf ( {members} ) .
+            """, format='turtle')
+            verbalizer = Verbalizer(Vocabulary(ontology), patterns=[owl_first_rest.OwlFirstRestPattern],
+                                    engine='native')
+            node = VerbalizationNode(ontology.value(URIRef('http://example.org/long'), OWL.unionOf))
+
+            tracemalloc.start()
+            try:
+                results = verbalizer.patterns[0].normalize(node, [], verbalizer.next_step(node))
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+            self.assertEqual(n_members, len(results))
+            self.assertEqual(n_members + 1, len(node.references[-1].node.get_path()))
+            return peak
+
+        small, large = peak_memory(1000), peak_memory(10000)
+
+        # copying the path of every cell would take ~100 times more memory for 10 times more members.
+        self.assertLess(large, small * 20)
+
+    def test_pattern_dispatch(self):
+        class CheckedPattern(owl_disjoint.OwlDisjointWith):
+            triggers = None
+            checks = 0
+
+            def check(self, results) -> bool:
+                CheckedPattern.checks += 1
+                return False
+
+        ontology = Processor.from_file('./data/people.ttl')
+        vocab = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)
+        patterns = [owl_disjoint.OwlDisjointWith, owl_restriction.OwlRestrictionPattern,
+                    owl_first_rest.OwlFirstRestPattern]
+
+        verbalizer = Verbalizer(vocab, patterns=patterns)
+        disjoint, restriction, first_rest = verbalizer.patterns
+        first, rest = first_rest.trigger_relations
+        self.assertEqual((), verbalizer._select_patterns([(URIRef('http://example.org/p'), URIRef('http://a'))]))
+        self.assertEqual((first_rest,), verbalizer._select_patterns([(first, URIRef('http://a')), (rest, RDF.nil)]))
+        self.assertEqual((), verbalizer._select_patterns([(first, URIRef('http://a'))]))
+
+        # patterns without triggers are always checked, after the ones that come before them.
+        verbalizer = Verbalizer(vocab, patterns=[CheckedPattern] + patterns)
+        self.assertEqual((verbalizer.patterns[0],),
+                         verbalizer._select_patterns([(URIRef('http://example.org/p'), URIRef('http://a'))]))
+        for concept in Processor._get_classes(ontology):
+            verbalizer.verbalize(concept)
+        self.assertLess(0, CheckedPattern.checks)
+
+    def test_subtree_cache(self):
+        ontology = Graph()
+        ontology.parse(data="""
+            @prefix : <http://example.org/> .
+            @prefix owl: <http://www.w3.org/2002/07/owl#> .
+            @prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+
+            :a a owl:Class ; rdfs:subClassOf [ a owl:Restriction ; owl:onProperty :part_of ; owl:someValuesFrom :x ] .
+            :b a owl:Class ; rdfs:subClassOf [ a owl:Restriction ; owl:onProperty :part_of ; owl:someValuesFrom :x ] .
+            :c a owl:Class ; rdfs:subClassOf [ a owl:Restriction ; owl:onProperty :part_of ; owl:someValuesFrom :y ] .
+        """, format='turtle')
+        vocab = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)
+        patterns = [owl_restriction.OwlRestrictionPattern]
+        verbalizer = Verbalizer(vocab, patterns=patterns)
+        cached_verbalizer = Verbalizer(vocab, patterns=patterns, subtree_cache_size=10)
+
+        hits, misses = 0, 0
+        for concept in ['http://example.org/a', 'http://example.org/b', 'http://example.org/c']:
+            fragment, text, _, stats = verbalizer.verbalize(concept)
+            cached_fragment, cached_text, _, cached_stats = cached_verbalizer.verbalize(concept)
+            self.assertEqual(fragment, cached_fragment)
+            self.assertEqual(text, cached_text)
+            self.assertEqual(stats.relationship_counter, cached_stats.relationship_counter)
+            self.assertEqual(stats.patterns_evaluated, cached_stats.patterns_evaluated)
+            # hashing a subtree fetches its nodes once, it is not reported as prefetching.
+            self.assertEqual(stats.graph_accesses, cached_stats.graph_accesses)
+            self.assertEqual(0, cached_stats.prefetched_lookups)
+            self.assertEqual(0, cached_stats.graph_accesses_saved)
+            hits += cached_stats.subtree_cache_hits
+            misses += cached_stats.subtree_cache_misses
+
+        self.assertEqual(1, hits)
+        self.assertEqual(2, misses)
+
+        # the cached subtrees do not keep the verbalizations that built them alive.
+        gc.collect()
+        self.assertEqual([], [obj for obj in gc.get_objects() if isinstance(obj, VerbalizationContext)])
+
+    def test_pattern_children_share_the_verbalization(self):
+        ontology = Graph()
+        ontology.parse(data="""
+            @prefix : <http://example.org/> .
+            @prefix owl: <http://www.w3.org/2002/07/owl#> .
+            @prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+
+            :a a owl:Class ; rdfs:subClassOf [ a owl:Restriction ; owl:onProperty :part_of ;
+                owl:someValuesFrom [ a owl:Restriction ; owl:onProperty :has_part ; owl:someValuesFrom :x ] ] .
+            :b a owl:Class ; rdfs:subClassOf [ a owl:Restriction ; owl:onProperty :part_of ;
+                owl:allValuesFrom [ a owl:Restriction ; owl:onProperty :has_part ; owl:someValuesFrom :x ] ] .
+            :c a owl:Class ; owl:disjointWith :d ;
+                rdfs:subClassOf [ a owl:Restriction ; owl:onProperty :part_of ; owl:someValuesFrom :y ] .
+            :e a owl:Class ; owl:disjointWith :d ;
+                rdfs:subClassOf [ a owl:Restriction ; owl:onProperty :part_of ; owl:someValuesFrom :y ] .
+        """, format='turtle')
+        vocab = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)
+        patterns = [owl_disjoint.OwlDisjointWith, owl_restriction.OwlRestrictionPattern]
+        verbalizer = Verbalizer(vocab, patterns=patterns, engine='native')
+        cached_verbalizer = Verbalizer(vocab, patterns=patterns, engine='native', subtree_cache_size=10)
+
+        # the nested restriction of :a and :b, and the restrictions of :c and :e, are built by a pattern.
+        hits, misses = 0, 0
+        for concept, blank_nodes in [('a', 2), ('b', 2), ('c', 1), ('e', 1)]:
+            concept = f'http://example.org/{concept}'
+            _, text, _, _ = verbalizer.verbalize(concept)
+            _, cached_text, _, cached_stats = cached_verbalizer.verbalize(concept)
+            self.assertEqual(text, cached_text)
+            hits += cached_stats.subtree_cache_hits
+            misses += cached_stats.subtree_cache_misses
+
+            # every node, the root included, is served from the prefetched description.
+            _, prefetched_text, _, prefetched_stats = verbalizer.verbalize(concept, prefetch=True)
+            self.assertEqual(text, prefetched_text)
+            self.assertEqual(1 + blank_nodes, prefetched_stats.prefetched_lookups)
+
+        self.assertEqual(2, hits)
+        self.assertEqual(4, misses)
+
+    def test_verbalization_with_workers(self):
+        ontology = Processor.from_file('./data/foaf.owl')
+        vocab = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)
+
+        with self.assertLogs('verbalizer.process', level='INFO') as logs:
+            results = Processor.verbalize_with(Verbalizer(vocab, language_model=CountingParaphraseModel()),
+                                               namespace='foaf')
+        parallel_model = CountingParaphraseModel()
+        with self.assertLogs('verbalizer.process', level='INFO') as parallel_logs:
+            parallel_results = Processor.verbalize_with(Verbalizer(vocab, language_model=parallel_model),
+                                                        namespace='foaf', workers=2)
+
+        self.assertEqual(results, parallel_results)
+
+        # the cost of every worker is accounted for, and added to the model of the caller.
+        cost = [line for line in logs.output if 'LLM usage cost' in line]
+        self.assertEqual(cost, [line for line in parallel_logs.output if 'LLM usage cost' in line])
+        self.assertEqual(['INFO:verbalizer.process:LLM usage cost: $5.0'], cost)
+        self.assertEqual(0, parallel_model.calls)
+        self.assertEqual(5.0, parallel_model.cost)
+
+        # workers that are not forked receive a pickled copy of the model, which fails before the run starts.
+        unpicklable_model = CountingParaphraseModel()
+        unpicklable_model.client = threading.Lock()
+        with mock.patch.object(Processor, '_pool_context', return_value=multiprocessing.get_context('spawn')), \
+                self.assertRaisesRegex(ValueError, 'cannot be pickled'):
+            Processor.verbalize_with(Verbalizer(vocab, language_model=unpicklable_model), namespace='foaf', workers=2)
+
+    def test_generator_memory_is_bounded(self):
+        def peak_memory(n_classes: int) -> int:
+            description = 'x' * 5000
+            ontology = Graph()
+            ontology.parse(data='@prefix : <http://example.org/> .\n' +
+                                '@prefix owl: <http://www.w3.org/2002/07/owl#> .\n' +
+                                '\n'.join(f':c{i} a owl:Class ; :has_description "{i}{description}" ; :related :c{i + 1} .'
+                                          for i in range(n_classes)), format='turtle')
+            verbalizer = Verbalizer(Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri), engine='native')
+
+            tracemalloc.start()
+            try:
+                for _ in Processor.verbalize_with(verbalizer, namespace='memory', chunk_size=50, as_generator=True):
+                    pass
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        small, large = peak_memory(100), peak_memory(600)
+
+        # retaining the rows would take more than 5MB for the large run.
+        self.assertLess(large - small, 1024 * 1024)
+
+    def test_jsonl_sink(self):
+        ontology = Processor.from_file('./data/foaf.owl')
+        verbalizer = Verbalizer(Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri))
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            results = Processor.verbalize_with(verbalizer, namespace='foaf', output_dir=output_dir, chunk_size=10,
+                                               sink=JsonlSink())
+            with open(next(Path(output_dir).glob('foaf/*/file_0.jsonl')), encoding='utf-8') as file:
+                rows = [json.loads(line) for line in file]
+
+        self.assertEqual(10, len(rows))
+        self.assertEqual(str(results[0]['root']), rows[0]['root'])
+        self.assertEqual(results[0]['text'], rows[0]['text'])
+        self.assertEqual(results[0]['total_relationships'], sum(rows[0]['relationships'].values()))
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_parquet_sink(self):
+        ontology = Processor.from_file('./data/foaf.owl')
+        verbalizer = Verbalizer(Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri))
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            sink = ParquetSink(row_group_size=4)
+            results = Processor.verbalize_with(verbalizer, namespace='foaf', output_dir=output_dir, chunk_size=10,
+                                               sink=sink)
+            parquet_file = pyarrow.parquet.ParquetFile(next(Path(output_dir).glob('foaf/*/file_0.parquet')))
+            table = parquet_file.read()
+
+        # every partition has the same schema, regardless of the relationships of its rows.
+        self.assertEqual(sink.schema, table.schema)
+        self.assertEqual(3, parquet_file.num_row_groups)
+        self.assertEqual(10, table.num_rows)
+        self.assertEqual(results[0]['text'], table.column('text')[0].as_py())
+        self.assertEqual(results[0]['total_relationships'],
+                         sum(count for _, count in table.column('relationships')[0].as_py()))
+
+    def test_resume_interrupted_run(self):
+        ontology = Processor.from_file('./data/foaf.owl')
+        vocab = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)
+        expected = Processor.verbalize_with(Verbalizer(vocab), namespace='foaf')
+
+        verbalizer = Verbalizer(vocab)
+        verbalize = verbalizer.verbalize
+        calls = []
+
+        def terminated_after_7(concept, *args, **kwargs):
+            calls.append(concept)
+            if len(calls) > 7:
+                os.kill(os.getpid(), signal.SIGTERM)
+            return verbalize(concept, *args, **kwargs)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            verbalizer.verbalize = terminated_after_7
+            with self.assertRaises(SystemExit):
+                Processor.verbalize_with(verbalizer, namespace='foaf', output_dir=output_dir, chunk_size=3,
+                                         run_id='run')
+
+            manifest = RunManifest.load(f'{output_dir}/foaf/run')
+            self.assertFalse(manifest.finished)
+            self.assertEqual(7, len(manifest.completed))
+            # checkpoints are appended to the log, the manifest is only written when the run starts.
+            with open(f'{output_dir}/foaf/run/{RunManifest.file_name}', encoding='utf-8') as file:
+                self.assertEqual([], json.load(file)['completed'])
+            with open(f'{output_dir}/foaf/run/{RunManifest.log_name}', encoding='utf-8') as file:
+                self.assertEqual(7, sum(len(json.loads(line)['completed']) for line in file))
+
+            # the completed roots are not verbalized again.
+            calls.clear()
+            verbalizer.verbalize = lambda concept, *args, **kwargs: calls.append(concept) or verbalize(concept)
+            resumed = Processor.verbalize_with(verbalizer, namespace='foaf', output_dir=output_dir, chunk_size=3,
+                                               run_id='run')
+            self.assertEqual(len(manifest.entries) - 7, len(calls))
+
+            manifest = RunManifest.load(f'{output_dir}/foaf/run')
+            self.assertTrue(manifest.finished)
+            self.assertEqual(len(manifest.entries), len(manifest.completed))
+            self.assertFalse(os.path.exists(f'{output_dir}/foaf/run/{RunManifest.log_name}'))
+            rows = pandas.concat([pandas.read_csv(f'{output_dir}/foaf/run/{partition}')
+                                  for partition in manifest.partitions])
+
+        self.assertEqual([str(row['root']) for row in expected], list(rows['root']))
+        self.assertEqual([row['text'] for row in expected[-len(resumed):]], [row['text'] for row in resumed])
+
+    def test_sigterm_handler_while_generator_is_suspended(self):
+        ontology = Processor.from_file('./data/foaf.owl')
+        verbalizer = Verbalizer(Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri))
+        previous_handler = signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        try:
+            with tempfile.TemporaryDirectory() as output_dir:
+                results = Processor.verbalize_with(verbalizer, namespace='foaf', output_dir=output_dir, chunk_size=3,
+                                                   run_id='run', as_generator=True)
+                next(results)
+                # the caller's handler applies while the generator waits for the caller.
+                self.assertEqual(signal.SIG_IGN, signal.getsignal(signal.SIGTERM))
+                row = next(results)
+                results.close()
+                self.assertEqual(signal.SIG_IGN, signal.getsignal(signal.SIGTERM))
+                # closing the generator flushes the partial chunk.
+                manifest = RunManifest.load(f'{output_dir}/foaf/run')
+                self.assertEqual(manifest.entries.index(str(row['root'])) + 1, len(manifest.completed))
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+    def test_workers_do_not_flush_on_sigterm(self):
+        previous_handler = signal.signal(signal.SIGTERM, process._exit_on_sigterm)
+        try:
+            with Processor._pool_context().Pool(1, initializer=process._init_worker, initargs=(None,)) as pool:
+                self.assertEqual(signal.SIG_DFL, pool.apply(signal.getsignal, (signal.SIGTERM,)))
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+
+    def test_incremental_verbalization(self):
+        def version(label_b: str, filler_c: str) -> Vocabulary:
+            ontology = Graph()
+            ontology.parse(data=f"""
+                @prefix : <http://example.org/> .
+                @prefix owl: <http://www.w3.org/2002/07/owl#> .
+                @prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+                :A a owl:Class ; rdfs:subClassOf :B .
+                :B a owl:Class ; rdfs:label "{label_b}" .
+                :C a owl:Class ; rdfs:subClassOf [ a owl:Restriction ; owl:onProperty :part_of ; owl:someValuesFrom :{filler_c} ] .
+                :D a owl:Class ; rdfs:subClassOf :E .
+                :E a owl:Class .
+            """, format='turtle')
+            return Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)
+
+        old, new = version('bone', 'E'), version('skeletal bone', 'D')
+        expected = Processor.verbalize_with(Verbalizer(new), namespace='example')
+
+        verbalizer = Verbalizer(new)
+        verbalize = verbalizer.verbalize
+        calls = []
+        verbalizer.verbalize = lambda concept, *args, **kwargs: calls.append(concept) or verbalize(concept)
+
+        with tempfile.TemporaryDirectory() as output_dir, \
+                mock.patch('verbalizer.incremental.closure_fingerprint', wraps=closure_fingerprint) as fingerprint:
+            Processor.verbalize_with(Verbalizer(old), namespace='example', output_dir=output_dir, run_id='old')
+            previous_run = PreviousRun(Verbalizer(old), f'{output_dir}/example/old')
+            results = Processor.verbalize_with(verbalizer, namespace='example', output_dir=output_dir, run_id='new',
+                                               previous_run=previous_run)
+            # the old run did not record its fingerprints, so they are computed for both versions.
+            self.assertEqual(2 * 5, fingerprint.call_count)
+            # A references the label of B, and the restriction of C has changed.
+            self.assertEqual({URIRef('http://example.org/A'), URIRef('http://example.org/B'),
+                              URIRef('http://example.org/C')}, set(calls))
+
+            # the new run recorded them, so each fingerprint is computed once when it is used as the previous run.
+            fingerprint.reset_mock()
+            calls.clear()
+            next_results = Processor.verbalize_with(verbalizer, namespace='example', output_dir=output_dir,
+                                                    run_id='next', previous_run=PreviousRun(Verbalizer(new),
+                                                                                            f'{output_dir}/example/new'))
+            self.assertEqual(5, fingerprint.call_count)
+            self.assertEqual([], calls)
+
+        self.assertEqual([(row['root'], row['text']) for row in expected], [(row['root'], row['text']) for row in results])
+        self.assertEqual([(row['root'], row['text']) for row in expected],
+                         [(row['root'], row['text']) for row in next_results])
+
+    def test_entity_enumeration(self):
+        ontology = Graph()
+        ontology.parse(data="""
+            @prefix : <http://example.org/> .
+            @prefix owl: <http://www.w3.org/2002/07/owl#> .
+            @prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+            :A a owl:Class ; rdfs:label "a", "first letter" ; rdfs:subClassOf :B .
+            :B a owl:Class ; rdfs:subClassOf :C .
+            :C a owl:Class ; owl:deprecated true .
+            :part_of a owl:ObjectProperty ; rdfs:domain :A .
+        """, format='turtle')
+
+        # multi-label classes are enumerated once, deprecated ones are skipped.
+        classes = Processor._get_classes(ontology)
+        self.assertEqual(2, len(classes))
+        self.assertEqual({URIRef('http://example.org/A'), URIRef('http://example.org/B')}, set(classes))
+        self.assertEqual(set(classes), set(Processor._get_classes(GraphIndex.from_graph(ontology))))
+
+        verbalizer = Verbalizer(Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri))
+        results = Processor.verbalize_with(verbalizer, namespace='example',
+                                           entity_types=[URIRef('http://www.w3.org/2002/07/owl#ObjectProperty')])
+        self.assertEqual([URIRef('http://example.org/part_of')], [row['root'] for row in results])
+
+    def test_streaming_sampler(self):
+        items = [URIRef(f'http://example.org/{namespace}/{i}') for namespace in ('a', 'b') for i in range(100)]
+
+        sampler = Sampler(sample_n=10, seed=42, streaming=True)
+        sample = sampler.get_sample({'items': lambda: iter(items)})['items']
+        self.assertEqual(10, len(sample))
+        self.assertEqual(10, len(set(sample)))
+
+        # the sample depends on the seed only, not on the order of the items.
+        reversed_sample = Sampler(sample_n=10, seed=42, streaming=True).get_sample({'items': items[::-1]})['items']
+        self.assertEqual(sample, reversed_sample)
+
+        sample = Sampler(sample_percentage=0.05, seed=42, streaming=True).get_sample({'items': items})['items']
+        self.assertEqual(10, len(sample))
+
+        # every stratum is sampled as a list of its own.
+        sampler = Sampler(sample_percentage=0.05, seed=42, stratify_by=Sampler.by_namespace)
+        sample = sampler.get_sample({'items': lambda: iter(items)})['items']
+        self.assertEqual(5, sum(1 for item in sample if '/a/' in item))
+        self.assertEqual(5, sum(1 for item in sample if '/b/' in item))
+
+        # sample_n is the size of the whole sample, split across the strata in proportion to their sizes.
+        uneven = items[:100] + items[100:130]
+        sample = Sampler(sample_n=13, seed=42, stratify_by=Sampler.by_namespace).get_sample({'items': uneven})['items']
+        self.assertEqual(13, len(sample))
+        self.assertEqual(10, sum(1 for item in sample if '/a/' in item))
+        self.assertEqual(3, sum(1 for item in sample if '/b/' in item))
+        sample = Sampler(sample_n=7, seed=42, stratify_by=Sampler.by_namespace).get_sample({'items': uneven})['items']
+        self.assertEqual(7, len(sample))
+        sample = Sampler(sample_n=500, seed=42, stratify_by=Sampler.by_namespace).get_sample({'items': uneven})['items']
+        self.assertEqual(set(uneven), set(sample))
+
+    def test_graph_snapshot(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            parsed = Processor.from_file('./data/foaf.owl', cache_dir=cache_dir)
+            self.assertEqual(1, len(list(Path(cache_dir).iterdir())))
+            loaded = Processor.from_file('./data/foaf.owl', cache_dir=cache_dir)
+
+        self.assertEqual(set(parsed), set(loaded))
+        parsed_verbalizer = Verbalizer(Vocabulary(parsed, ignore=ignore_iri, rephrased=rename_iri))
+        loaded_verbalizer = Verbalizer(Vocabulary(loaded, ignore=ignore_iri, rephrased=rename_iri))
+        for concept in Processor._get_classes(parsed):
+            self.assertEqual(parsed_verbalizer.verbalize(concept)[:3], loaded_verbalizer.verbalize(concept)[:3])
+
+    def test_format_detection(self):
+        owl_class = '<http://www.w3.org/2002/07/owl#Class>'
+        documents = {
+            'statement.ttl': f'<urn:x> a {owl_class} .\n',
+            'subject.ttl': f'<urn:x>\n    a {owl_class} .\n',
+            'relative.ttl': f'<x> a {owl_class} .\n',
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            for name, document in documents.items():
+                Path(directory, name).write_text(document, encoding='utf-8')
+                for cache_dir in (None, directory):
+                    graph = Processor.from_file(str(Path(directory, name)), cache_dir=cache_dir)
+                    self.assertEqual(1, len(graph), name)
+
+            self.assertEqual('xml', sniff_format('./data/foaf.owl'))
+            self.assertEqual('n3', sniff_format('./data/Pizza.ttl'))
+            self.assertEqual('n3', sniff_format(str(Path(directory, 'statement.ttl'))))
+
+    def test_single_pass_labels_match_sparql(self):
+        for file_path in ('./data/foaf.owl', './data/Pizza.ttl', './data/ro.owl'):
+            ontology = Processor.from_file(file_path)
+            ontology.remove((None, OWL.imports, None))
+            vocab = Vocabulary(ontology)
+            relationship_labels, object_labels = sparql_label_maps(vocab)
+            self.assertEqual(relationship_labels, vocab.relationship_labels, file_path)
+            self.assertEqual(object_labels, vocab.object_labels, file_path)
+
+    def test_vocabulary_snapshot(self):
+        ontology = Processor.from_file('./data/foaf.owl')
+        expected = Vocabulary(ontology)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            fingerprint = file_digest('./data/foaf.owl')
+            Vocabulary(ontology, cache_dir=cache_dir, fingerprint=fingerprint)
+            self.assertEqual(1, len(list(Path(cache_dir).iterdir())))
+
+            # the labels are loaded from the snapshot, not from the graph.
+            loaded = Vocabulary(Graph(), ignore=ignore_iri, cache_dir=cache_dir, fingerprint=fingerprint)
+            self.assertEqual(list(expected.relationship_labels.items()), list(loaded.relationship_labels.items()))
+            self.assertEqual(list(expected.object_labels.items()), list(loaded.object_labels.items()))
+
+            # without a fingerprint, the snapshot is keyed by the file the graph was loaded from, without hashing it.
+            with mock.patch('verbalizer.snapshot._blank_node_digests') as digests:
+                Vocabulary(ontology, cache_dir=cache_dir)
+                Vocabulary(GraphIndex.from_graph(ontology), cache_dir=cache_dir)
+                Vocabulary(Processor.from_file('./data/people.ttl'), cache_dir=cache_dir)
+                self.assertEqual(2, len(list(Path(cache_dir).iterdir())))
+                self.assertEqual(expected.object_labels, Vocabulary(ontology, cache_dir=cache_dir).object_labels)
+            digests.assert_not_called()
+
+            # a graph that was not loaded from a file, or changed since, requires a fingerprint.
+            for graph in (Graph(), Processor.from_file('./data/people.ttl')):
+                graph.add((URIRef('http://example.org/a'), RDF.type, OWL.Class))
+                with self.assertRaises(ValueError):
+                    Vocabulary(graph, cache_dir=cache_dir)
+
+        # every parse names the blank nodes differently, the fingerprint of the graph does not depend on it.
+        fingerprints = set()
+        for _ in range(2):
+            pizza = Processor.from_file('./data/Pizza.ttl')
+            fingerprints.add(graph_fingerprint(pizza))
+        self.assertEqual(1, len(fingerprints))
+
+        # but the content of the blank nodes does.
+        restriction = next(pizza.subjects(OWL.someValuesFrom, None))
+        pizza.set((restriction, OWL.someValuesFrom, OWL.Thing))
+        self.assertNotIn(graph_fingerprint(pizza), fingerprints)
+
+    def test_lazy_vocabulary(self):
+        for file_path in ('./data/foaf.owl', './data/people.ttl'):
+            ontology = Processor.from_file(file_path)
+            eager = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)
+            lazy = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri, lazy=True)
+            self.assertEqual(0, len(lazy.object_labels))
+
+            terms = {term for triple in ontology for term in triple}
+            for term in terms | {str(term) for term in terms}:
+                self.assertEqual(eager.get_class_label(term), lazy.get_class_label(term))
+                self.assertEqual(eager.get_relationship_label(term), lazy.get_relationship_label(term))
+
+            expected = Processor.verbalize_with(Verbalizer(eager), namespace='eager')
+            results = Processor.verbalize_with(Verbalizer(lazy), namespace='lazy')
+            self.assertEqual([(row['root'], row['text']) for row in expected],
+                             [(row['root'], row['text']) for row in results])
+
+    def test_label_cache(self):
+        ontology = Processor.from_file('./data/foaf.owl')
+        vocab = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri, label_cache_size=2)
+        uncached = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri, label_cache_size=0)
+
+        iris = ['http://xmlns.com/foaf/0.1/Person', 'http://example.org/SomeUnlabeledThing',
+                'http://www.w3.org/2000/01/rdf-schema#subClassOf', 'http://www.w3.org/2000/01/rdf-schema#label']
+        for _ in range(2):
+            for iri in iris:
+                self.assertEqual(uncached.get_class_label(iri), vocab.get_class_label(iri))
+                self.assertEqual(uncached.get_relationship_label(iri), vocab.get_relationship_label(iri))
+        # only 2 labels are kept per map, so every lookup misses.
+        self.assertEqual((0, 16), (vocab.label_cache_hits, vocab.label_cache_misses))
+        self.assertEqual(0, uncached.label_cache_misses)
+
+        vocab.get_class_label(iris[-1])
+        self.assertEqual(1, vocab.label_cache_hits)
+
+        # changing the configuration invalidates the memoized labels.
+        vocab.rephrased = {iris[0]: 'human'}
+        self.assertEqual('human', vocab.get_class_label(iris[0]))
+        vocab.ignore = {iris[0]}
+        self.assertIs(Vocabulary.IGNORE_VALUE, vocab.get_class_label(iris[0]))
+
+        # so does replacing a label map, even with one that reuses the id of the previous map.
+        vocab.ignore = set()
+        self.assertEqual('human', vocab.get_class_label(iris[0]))
+        vocab.rephrased = {}
+        with mock.patch('verbalizer.vocabulary.id', create=True, return_value=0):
+            vocab.object_labels = {**vocab.object_labels, iris[0]: 'individual'}
+            self.assertEqual('individual', vocab.get_class_label(iris[0]))
+            vocab.object_labels = {iris[0]: 'someone'}
+            self.assertEqual('someone', vocab.get_class_label(iris[0]))
+
+        _, _, _, stats = Verbalizer(vocab).verbalize('http://xmlns.com/foaf/0.1/Person')
+        self.assertGreater(stats.label_cache_hits + stats.label_cache_misses, 0)
+
+    def test_import_resolver(self):
+        prefixes = """
+            @prefix : <http://example.org/terms#> .
+            @prefix owl: <http://www.w3.org/2002/07/owl#> .
+            @prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+        """
+        ontologies = {
+            # a diamond (a and b import c) with a cycle (c imports a).
+            'a.owl': '<http://example.org/a> a owl:Ontology ; owl:imports <http://example.org/c> . :X rdfs:label "a" .',
+            'b.ttl': '<http://example.org/b> a owl:Ontology ; owl:imports <http://example.org/c> . :X rdfs:label "b" .',
+            'c.owl': '<http://example.org/c> a owl:Ontology ; owl:imports <http://example.org/a> . '
+                     ':X rdfs:label "c" . :Y rdfs:label "only c" .',
+        }
+        ontology = Graph()
+        ontology.parse(data=prefixes + """
+            <http://example.org/root> a owl:Ontology ;
+                owl:imports <http://example.org/a>, <http://example.org/b>, <http://example.org/missing> .
+        """, format='turtle')
+
+        with tempfile.TemporaryDirectory() as mirror_dir:
+            for name, content in ontologies.items():
+                Path(mirror_dir, name).write_text(prefixes + content, encoding='utf-8')
+            Path(mirror_dir, 'catalog-v001.xml').write_text(
+                '<catalog xmlns="urn:oasis:names:tc:entity:xmlns:xml:catalog">'
+                '<uri name="http://example.org/b" uri="b.ttl"/></catalog>', encoding='utf-8')
+            resolver = ImportResolver(catalog=f'{mirror_dir}/catalog-v001.xml', mirror_dir=mirror_dir, offline=True)
+
+            imports = resolver.closure(ontology)
+            self.assertEqual(['http://example.org/a', 'http://example.org/b', 'http://example.org/c'], list(imports))
+            self.assertIs(imports['http://example.org/c'][0], resolver.load('http://example.org/c'))
+
+            eager = Vocabulary(ontology, import_resolver=resolver)
+            lazy = Vocabulary(ontology, import_resolver=resolver, lazy=True)
+
+            # a snapshot taken without the imports, or without some of them, is not loaded when they are merged.
+            with tempfile.TemporaryDirectory() as cache_dir:
+                Vocabulary(ontology, cache_dir=cache_dir, fingerprint='f', load_imports=False)
+                Vocabulary(ontology, cache_dir=cache_dir, fingerprint='f',
+                           import_resolver=ImportResolver(mirror_dir=cache_dir, offline=True))
+                snapshotted = Vocabulary(ontology, cache_dir=cache_dir, fingerprint='f', import_resolver=resolver)
+                self.assertEqual(3, len(list(Path(cache_dir).iterdir())))
+                self.assertEqual(eager.object_labels, snapshotted.object_labels)
+
+                # the imports are not loaded when the labels come from the snapshot.
+                with mock.patch.object(ImportResolver, 'load', side_effect=AssertionError):
+                    snapshotted = Vocabulary(ontology, cache_dir=cache_dir, fingerprint='f', import_resolver=resolver)
+                self.assertEqual(eager.object_labels, snapshotted.object_labels)
+
+                # but a change to an import of an import is noticed.
+                Path(mirror_dir, 'c.owl').write_text(prefixes + ontologies['c.owl'].replace('only c', 'changed c'),
+                                                     encoding='utf-8')
+                clear_import_cache()
+                snapshotted = Vocabulary(ontology, cache_dir=cache_dir, fingerprint='f', import_resolver=resolver)
+                self.assertEqual('changed c', snapshotted.get_class_label('http://example.org/terms#Y'))
+
+        # the labels of an import take precedence over the labels of the ontologies that import it.
+        for vocab in (eager, lazy):
+            self.assertEqual('c', vocab.get_class_label('http://example.org/terms#X'))
+            self.assertEqual('only c', vocab.get_class_label('http://example.org/terms#Y'))
+        self.assertEqual({}, Vocabulary(ontology, load_imports=False).object_labels)
+
+    def test_sqlite_store(self):
+        ontology = Processor.from_file('./data/foaf.owl')
+        expected = Processor.verbalize_with(Verbalizer(Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)),
+                                            namespace='foaf')
+
+        with tempfile.TemporaryDirectory() as db_dir:
+            store = SQLiteStore(f'{db_dir}/foaf.db')
+            self.assertEqual(len(ontology), store.load('./data/foaf.owl'))
+            store.close()
+
+            # the store is reopened from disk, and the rows, fragments included, are identical.
+            graph = Graph(store=SQLiteStore(f'{db_dir}/foaf.db'))
+            for engine in ('sparql', 'native'):
+                verbalizer = Verbalizer(Vocabulary(graph, ignore=ignore_iri, rephrased=rename_iri), engine=engine)
+                results = Processor.verbalize_with(verbalizer, namespace='foaf')
+                self.assertEqual(expected, results)
+
+            # a verbalizer over the store can be used from several threads.
+            verbalizer = Verbalizer(Vocabulary(graph, ignore=ignore_iri, rephrased=rename_iri))
+            with ThreadPoolExecutor(2) as executor:
+                threaded = list(executor.map(lambda row: verbalizer.verbalize(row['root'])[1], expected))
+            self.assertEqual([row['text'] for row in expected], threaded)
+            graph.close()
+
+            # the triples of every pattern come in the same order as from the in-memory store.
+            ex = 'http://example.org/'
+            memory, stored = Graph(), Graph(store=SQLiteStore(f'{db_dir}/order.db'))
+            s1, s2, p1, p2, o1, o2 = (URIRef(ex + name) for name in ('s1', 's2', 'p1', 'p2', 'o1', 'o2'))
+            for triple in [(s1, p2, o2), (s2, p2, o1), (s1, p1, o1), (s1, p1, o2), (s2, p1, o1), (s1, p2, o1),
+                           (s2, p2, o2), (s2, p1, o2)]:
+                memory.add(triple)
+                stored.add(triple)
+            for pattern in itertools.product(*((None, s1), (None, p2), (None, o1))):
+                if pattern == (None, None, None):
+                    # the in-memory store returns all the triples from a set, the SQLite store in insertion order.
+                    self.assertEqual(set(memory), set(stored))
+                    continue
+                self.assertEqual(list(memory.triples(pattern)), list(stored.triples(pattern)), pattern)
+            stored.close()
+
+    def test_sharded_run(self):
+        ontology = Processor.from_file('./data/foaf.owl')
+        verbalizer = Verbalizer(Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri))
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            expected = Processor.verbalize_with(verbalizer, namespace='foaf', output_dir=output_dir, run_id='single')
+
+            shards = []
+            for shard_index in range(3):
+                shards.append(Processor.verbalize_with(verbalizer, namespace='foaf', output_dir=output_dir,
+                                                       run_id='sharded', shard_index=shard_index, shard_count=3))
+            shard_dirs = [f'{output_dir}/foaf/sharded/shard_{shard_index}_of_3' for shard_index in range(3)]
+
+            with self.assertRaises(ValueError):
+                merge_shards(shard_dirs[:2], f'{output_dir}/merged')
+
+            manifest = merge_shards(shard_dirs, f'{output_dir}/merged', chunk_size=4)
+            merged = pandas.concat([pandas.read_csv(f'{output_dir}/merged/{partition}')
+                                    for partition in manifest.partitions])
+            single_manifest = RunManifest.load(f'{output_dir}/foaf/single')
+
+        # every root is in exactly one shard, and the merged dataset is in the order of the single run.
+        self.assertEqual(sorted(row['root'] for row in expected), sorted(row['root'] for shard in shards for row in shard))
+        self.assertTrue(all(len(shard) > 0 for shard in shards))
+        self.assertEqual([str(row['root']) for row in expected], list(merged['root']))
+        self.assertEqual([row['text'] for row in expected], list(merged['text']))
+        self.assertEqual(single_manifest.entries, manifest.entries)
+        self.assertEqual(single_manifest.llm_cost, manifest.llm_cost)
+
+    def test_sharded_sampled_run(self):
+        ontology = Processor.from_file('./data/Pizza.ttl')
+        ontology.remove((None, OWL.imports, None))
+        verbalizer = Verbalizer(Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri), engine='native')
+        iter_entities = Processor.iter_entities
+
+        def shuffled_entities(graph, rdf_type, seed):
+            entities = list(iter_entities(graph, rdf_type))
+            random.Random(seed).shuffle(entities)
+            return iter(entities)
+
+        with self.assertRaises(ValueError):
+            Processor.verbalize_with(verbalizer, namespace='pizza', sampler=Sampler(sample_n=20, seed=1),
+                                     shard_count=2)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            expected = Processor.verbalize_with(verbalizer, namespace='pizza',
+                                                sampler=Sampler(sample_n=20, seed=1, streaming=True))
+
+            # every host enumerates the entities in a different order.
+            for shard_index in range(3):
+                with mock.patch.object(Processor, 'iter_entities',
+                                       functools.partial(shuffled_entities, seed=shard_index)):
+                    Processor.verbalize_with(verbalizer, namespace='pizza', output_dir=output_dir, run_id='sharded',
+                                             sampler=Sampler(sample_n=20, seed=1, streaming=True),
+                                             shard_index=shard_index, shard_count=3)
+            manifest = merge_shards([f'{output_dir}/pizza/sharded/shard_{shard_index}_of_3' for shard_index in range(3)],
+                                    f'{output_dir}/merged')
+            merged = pandas.concat([pandas.read_csv(f'{output_dir}/merged/{partition}')
+                                    for partition in manifest.partitions])
+
+        # the union of the shards is the unsharded sample, in the same order.
+        self.assertEqual(20, sum(1 for row in expected if (row['root'], RDF.type, OWL.Class) in ontology))
+        self.assertEqual([str(row['root']) for row in expected], list(merged['root']))
+        self.assertEqual([row['text'] for row in expected], list(merged['text']))
+
+    def test_stage_timings(self):
+        ontology = Processor.from_file('./data/foaf.owl')
+        vocab = Vocabulary(ontology, ignore=ignore_iri, rephrased=rename_iri)
+        verbalizer = Verbalizer(vocab, timings=True, language_model=CountingParaphraseModel())
+
+        concept = URIRef('http://xmlns.com/foaf/0.1/Person')
+        fragment, text, _, stats = verbalizer.verbalize(concept)
+        self.assertEqual((fragment, text), Verbalizer(vocab).verbalize(concept)[:2])
+        self.assertEqual(set(Verbalizer.stages) | {'total'}, set(stats.timings))
+        self.assertGreater(stats.timings['graph_query'], 0)
+        self.assertGreater(stats.timings['llm'], 0)
+        # the stages do not overlap.
+        self.assertLessEqual(sum(stats.timings[stage] for stage in Verbalizer.stages), stats.timings['total'])
+        self.assertEqual({}, Verbalizer(vocab).verbalize(concept)[3].timings)
+
+        # lookups made by the patterns and the fragment are charged to label_lookup as well.
+        class SlowVocabulary(Vocabulary):
+            lookups = 0
+
+            def _util_lookup(self, dictionary, val):
+                SlowVocabulary.lookups += 1
+                time.sleep(0.002)
+                return super()._util_lookup(dictionary, val)
+
+        pizza = Processor.from_file('./data/Pizza.ttl')
+        pizza.remove((None, OWL.imports, None))
+        slow = SlowVocabulary(pizza, ignore=ignore_iri, rephrased=rename_iri)
+        patterns = [owl_disjoint.OwlDisjointWith, owl_restriction.OwlRestrictionPattern, owl_first_rest.OwlFirstRestPattern]
+        stats = Verbalizer(slow, patterns=patterns, timings=True).verbalize(
+            URIRef('http://www.co-ode.org/ontologies/pizza/2005/10/18/pizza.owl#American'))[3]
+        self.assertGreater(SlowVocabulary.lookups, 0)
+        self.assertGreaterEqual(stats.timings['label_lookup'], SlowVocabulary.lookups * 0.002)
+        self.assertLess(stats.timings['pattern'] + stats.timings['fragment'], SlowVocabulary.lookups * 0.002 / 2)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            Processor.verbalize_with(verbalizer, namespace='foaf', output_dir=output_dir)
+            with open(next(Path(output_dir).glob('foaf/*/*/timings.json')), encoding='utf-8') as file:
+                summary = json.load(file)
+
+        self.assertEqual(15, summary['total']['count'])
+        self.assertEqual({'count', 'total', 'mean', 'p50', 'p95', 'p99'}, set(summary['graph_query']))
+        self.assertLessEqual(summary['graph_query']['p50'], summary['graph_query']['p99'])
+        self.assertIn('graph_accesses', summary)
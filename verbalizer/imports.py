@@ -0,0 +1,154 @@
+import logging
+import threading
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from rdflib import Graph, OWL, RDF
+
+from verbalizer.snapshot import file_digest, parse_file
+
+logger = logging.getLogger(__name__)
+
+# the import graphs loaded by this process, by location. A location is only parsed once, even by concurrent resolvers,
+# and its graph is kept until `clear_import_cache` is called. The graphs are shared, not copied, so they must not be
+# changed.
+_graphs: dict[str, Future] = {}
+_graphs_lock = threading.Lock()
+
+
+def clear_import_cache():
+    """
+    Forget the import graphs loaded by this process.
+    """
+    with _graphs_lock:
+        _graphs.clear()
+
+
+class ImportResolver:
+    """
+    Resolves the owl:imports of an ontology. Imports are looked up in an XML catalog (such as the `catalog-v001.xml`
+    written by Protégé) and in a mirror directory before they are fetched from their IRI, and every location is parsed
+    once per process.
+    """
+
+    def __init__(self, catalog: Optional[str] = None, mirror_dir: Optional[str] = None, workers: int = 4,
+                 offline: bool = False):
+        """
+        :param catalog: Path of an XML catalog that maps the IRIs of imports to files.
+        :param mirror_dir: Directory of local copies of the imports, named after the last segment of their IRI,
+        e.g. `core.owl` for http://purl.obolibrary.org/obo/ro/core.owl.
+        :param workers: Number of imports loaded at the same time.
+        :param offline: If True, imports that are neither in the catalog nor in the mirror directory are skipped instead
+        of being fetched.
+        """
+        if workers < 1:
+            raise ValueError('workers must be at least 1')
+        self.catalog = self._read_catalog(catalog) if catalog else {}
+        self.mirror_dir = Path(mirror_dir) if mirror_dir else None
+        self.workers = workers
+        self.offline = offline
+
+    @staticmethod
+    def _read_catalog(path: str) -> dict[str, str]:
+        """
+        :return: IRI to location of the `uri` entries of the catalog. Relative locations are relative to the catalog.
+        """
+        locations = {}
+        for element in ElementTree.parse(path).getroot().iter():
+            if element.tag.rsplit('}', 1)[-1] != 'uri' or not element.get('name') or not element.get('uri'):
+                continue
+            location = element.get('uri')
+            if '://' not in location:
+                location = str(Path(path).parent / location.removeprefix('file:'))
+            locations[element.get('name')] = location
+        return locations
+
+    def location(self, iri: str) -> Optional[str]:
+        """
+        :return: Where an import is loaded from, or None if it cannot be resolved.
+        """
+        if location := self.catalog.get(iri):
+            return location
+        if self.mirror_dir:
+            name = iri.rstrip('/#').rsplit('/', 1)[-1]
+            for candidate in (name, f'{name}.owl'):
+                if name and (self.mirror_dir / candidate).is_file():
+                    return str(self.mirror_dir / candidate)
+        return None if self.offline else iri
+
+    def load(self, iri: str) -> Optional[Graph]:
+        """
+        Load the graph of an import, or return it from the graphs this process has already loaded. The graph is shared
+        with every other caller that loads the same location, so it must not be changed.
+        :return: The graph, or None if the import cannot be resolved.
+        """
+        location = self.location(iri)
+        if location is None:
+            logger.warning(f'Skipping import {iri}, it is not in the catalog or the mirror directory')
+            return None
+
+        with _graphs_lock:
+            future = _graphs.get(location)
+            owner = future is None
+            if owner:
+                future = _graphs[location] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            logger.info(f'LOADING IMPORT: {iri} from {location}')
+            if Path(location).is_file():
+                graph = parse_file(location)
+            else:
+                # a remote import is fetched from its IRI, which serves RDF/XML.
+                graph = Graph()
+                graph.parse(location, format='xml')
+        except BaseException as error:
+            with _graphs_lock:
+                del _graphs[location]
+            future.set_exception(error)
+            raise
+        future.set_result(graph)
+        return graph
+
+    def fingerprint(self, iri: str) -> str:
+        """
+        Identify the content of an import without loading it.
+        :return: The digest of its file, the location it is fetched from if it is remote (so a change of a remote import
+        goes unnoticed), or 'unresolved' if it cannot be resolved.
+        """
+        location = self.location(iri)
+        if location is None:
+            return 'unresolved'
+        return file_digest(location) if Path(location).is_file() else location
+
+    @staticmethod
+    def imports_of(graph: Graph) -> list[str]:
+        """
+        :return: The IRIs imported by a graph, sorted.
+        """
+        return sorted({str(iri) for iri in graph.objects(None, OWL.imports)})
+
+    def closure(self, graph: Graph) -> dict[str, tuple[Graph, list[str]]]:
+        """
+        Load every import reachable from a graph. The imports of a level are loaded concurrently, and every import is
+        loaded once, even if it is imported several times or through a cycle.
+        :return: IRI to (graph, IRIs it imports) of every import that could be resolved, in breadth-first order.
+        """
+        imports = {}
+        # an import of the ontology itself closes a cycle.
+        seen = {str(iri) for iri in graph.subjects(RDF.type, OWL.Ontology)}
+        frontier = self.imports_of(graph)
+        with ThreadPoolExecutor(self.workers) as pool:
+            while frontier:
+                batch = [iri for iri in dict.fromkeys(frontier) if iri not in seen]
+                seen.update(batch)
+                frontier = []
+                for iri, imported in zip(batch, pool.map(self.load, batch)):
+                    if imported is None:
+                        continue
+                    imports[iri] = (imported, self.imports_of(imported))
+                    frontier.extend(imports[iri][1])
+        return imports
@@ -0,0 +1,167 @@
+import hashlib
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from rdflib import URIRef, BNode
+from tqdm import tqdm
+
+from verbalizer.manifest import RunManifest
+from verbalizer.sinks import read_partition
+from verbalizer.verbalizer import Verbalizer, VerbalizationNode
+from verbalizer.vocabulary import Vocabulary
+
+logger = logging.getLogger(__name__)
+
+
+def closure_fingerprint(verbalizer: Verbalizer, root: URIRef) -> str:
+    """
+    Compute a fingerprint of everything the verbalization of a root depends on: the triples of the root, the triples of
+    the blank nodes reachable from it and the labels of the concepts and relationships they reference.
+    Blank nodes are identified by their position in the closure, so the fingerprint does not depend on how the
+    ontology was parsed.
+    :param verbalizer: The verbalizer of the ontology version.
+    :param root: The root concept.
+    :return: The hex digest of the fingerprint.
+    """
+    vocab = verbalizer.vocab
+    digest = hashlib.blake2b(digest_size=16)
+
+    def label(value) -> str:
+        return '\x00ignored' if value is Vocabulary.IGNORE_VALUE else str(value)
+
+    digest.update(label(vocab.get_class_label(root)).encode() + b'\x1d')
+
+    positions = {}
+    pending = [root]
+    while pending:
+        concept = pending.pop(0)
+        digest.update(b'\x1c')
+        for relation, obj in verbalizer.next_step(VerbalizationNode(concept)):
+            digest.update(relation.n3().encode() + b'\x1f' +
+                          label(vocab.get_relationship_label(relation)).encode() + b'\x1f')
+            if isinstance(obj, BNode):
+                if obj not in positions:
+                    positions[obj] = len(positions)
+                    pending.append(obj)
+                digest.update(f'_:{positions[obj]}'.encode())
+            elif isinstance(obj, URIRef):
+                digest.update(obj.n3().encode() + b'\x1f' + label(vocab.get_class_label(obj)).encode())
+            else:
+                digest.update(obj.n3().encode())
+            digest.update(b'\x1e')
+
+    return digest.hexdigest()
+
+
+class PreviousRun:
+    """
+    A finished run of an earlier version of an ontology, used to verbalize a new version incrementally: the rows of the
+    roots whose closure did not change are carried forward as they are, and only the other roots are verbalized (and
+    paraphrased) again.
+    """
+
+    def __init__(self, verbalizer: Verbalizer, run_dir: str):
+        """
+        :param verbalizer: The verbalizer of the earlier version, with the same configuration as the current one.
+        :param run_dir: The output directory of the run.
+        """
+        manifest = RunManifest.load(run_dir)
+        if manifest is None:
+            raise ValueError(f'{run_dir} does not hold a verbalization run')
+        if not manifest.finished:
+            raise ValueError(f'The run in {run_dir} is not finished')
+
+        self.verbalizer = verbalizer
+        self.run_dir = run_dir
+        self.manifest = manifest
+
+    def carry_forward(self, verbalizer: Verbalizer, entries: Iterable[URIRef],
+                      fingerprints: Optional[dict[str, str]] = None) -> 'CarriedRows':
+        """
+        Find the entries that do not have to be verbalized again. The fingerprints of the closures of the previous
+        version are taken from the manifest of the run when it recorded them, and computed otherwise.
+        :param verbalizer: The verbalizer of the current version.
+        :param entries: The entries of the current run.
+        :param fingerprints: If set, the fingerprint of the closure of every entry in the current version is stored in
+        it, so that the run can record them for the next version.
+        :return: The rows to carry forward.
+        """
+        previous_entries = set(self.manifest.entries)
+        recorded = self.manifest.fingerprints
+        llm = verbalizer.llm
+        model = llm.name if llm else 'None'
+
+        unchanged = set()
+        for entry in tqdm(entries, desc='Comparing Closures'):
+            if str(entry) not in previous_entries and fingerprints is None:
+                continue
+            fingerprint = closure_fingerprint(verbalizer, entry)
+            if fingerprints is not None:
+                fingerprints[str(entry)] = fingerprint
+            if str(entry) not in previous_entries:
+                continue
+            previous_fingerprint = recorded.get(str(entry)) or closure_fingerprint(self.verbalizer, entry)
+            if fingerprint == previous_fingerprint:
+                unchanged.add(entry)
+
+        # only the roots are collected here, the rows are read again when they are carried forward.
+        roots_with_rows = set()
+        for row, _ in self._rows():
+            if row['root'] not in unchanged:
+                continue
+            if row['model'] != model:
+                # paraphrased by another model, so the row is verbalized again.
+                unchanged.discard(row['root'])
+                continue
+            roots_with_rows.add(row['root'])
+
+        logger.info(f'Carrying forward {len(unchanged)} unchanged entries')
+        return CarriedRows(unchanged, roots_with_rows, self._rows())
+
+    def _rows(self) -> Iterator[tuple[dict, Counter]]:
+        """
+        :return: Generator of the (row, relationships) of the run, in order.
+        """
+        for partition in self.manifest.partitions:
+            yield from read_partition(str(Path(self.run_dir) / partition))
+
+
+class CarriedRows:
+    """
+    The entries carried forward from a previous run. The rows are streamed from the partitions of the run as they are
+    requested, so only the rows that are read ahead of the entry being requested are held in memory, which is none of
+    them when the entries are requested in the order of the previous run.
+    """
+
+    def __init__(self, entries: set, entries_with_rows: set, rows: Iterator[tuple[dict, Counter]]):
+        """
+        :param entries: The entries that are carried forward.
+        :param entries_with_rows: The entries that produced a row in the previous run.
+        :param rows: The (row, relationships) of the previous run, in order.
+        """
+        self._entries = entries
+        self._entries_with_rows = entries_with_rows
+        self._rows = rows
+        self._read_ahead: dict[str, tuple[dict, Counter]] = {}
+
+    def __contains__(self, entry) -> bool:
+        return entry in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def pop(self, entry: URIRef) -> Optional[tuple[dict, Counter]]:
+        """
+        Get the row of an entry that is carried forward. Every row can be requested once.
+        :param entry: The entry.
+        :return: The (row, relationships), or None if the entry did not produce a row.
+        """
+        if entry not in self._entries_with_rows:
+            return None
+        while entry not in self._read_ahead:
+            row, relationships = next(self._rows)
+            if row['root'] in self._entries_with_rows:
+                self._read_ahead[row['root']] = (row, relationships)
+        return self._read_ahead.pop(entry)
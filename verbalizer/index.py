@@ -0,0 +1,187 @@
+import logging
+from typing import Iterator, Optional
+
+import numpy
+from rdflib import Graph
+from rdflib.term import Node
+from tqdm import tqdm
+
+from verbalizer.snapshot import record_source, source_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+class GraphIndex:
+    """
+    A read-only, compact adjacency index of an ontology.
+
+    Every term is interned to an integer and the outgoing edges of each subject are stored in compressed sparse row
+    (CSR) arrays: `offsets[i]:offsets[i + 1]` is the slice of `predicates` and `objects` that holds the edges of the
+    term with id `i`. The edges of a subject are kept in the same order as the graph they were built from.
+
+    The index exposes the subset of the `rdflib.Graph` read API used by the verbalizer, so it can be used in place of
+    the graph once built.
+    """
+
+    def __init__(self, terms: list[Node], offsets: numpy.ndarray, predicates: numpy.ndarray, objects: numpy.ndarray):
+        """
+        :param terms: The interned terms, where the position of a term is its id.
+        :param offsets: CSR row offsets, of size len(terms) + 1.
+        :param predicates: Predicate id of every edge.
+        :param objects: Object id of every edge.
+        """
+        self.terms = terms
+        self.offsets = offsets
+        self.predicates_ids = predicates
+        self.objects_ids = objects
+        self._ids = {term: i for i, term in enumerate(terms)}
+
+    @classmethod
+    def from_graph(cls, graph: Graph) -> 'GraphIndex':
+        """
+        Build the index from a graph. This requires a single pass over the triples of the graph.
+        :param graph: The ontology.
+        :return: The index.
+        """
+        ids: dict[Node, int] = {}
+        terms: list[Node] = []
+
+        def intern(term: Node) -> int:
+            term_id = ids.get(term)
+            if term_id is None:
+                term_id = ids[term] = len(terms)
+                terms.append(term)
+            return term_id
+
+        subjects, predicates, objects = [], [], []
+        for subject in tqdm(graph.subjects(unique=True), desc='Building Graph Index'):
+            subject_id = intern(subject)
+            for predicate, obj in graph.predicate_objects(subject):
+                subjects.append(subject_id)
+                predicates.append(intern(predicate))
+                objects.append(intern(obj))
+
+        subjects = numpy.array(subjects, dtype=numpy.int32)
+
+        # Edges are grouped by subject already, a stable sort puts the groups in id order without reordering them.
+        order = numpy.argsort(subjects, kind='stable')
+        offsets = numpy.zeros(len(terms) + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(subjects, minlength=len(terms)), out=offsets[1:])
+
+        index = cls(
+            terms,
+            offsets,
+            numpy.array(predicates, dtype=numpy.int32)[order],
+            numpy.array(objects, dtype=numpy.int32)[order]
+        )
+        logger.info(f'Indexed {len(index)} triples and {len(terms)} terms')
+        record_source(index, source_fingerprint(graph))
+        return index
+
+    def __len__(self) -> int:
+        return len(self.objects_ids)
+
+    def __iter__(self) -> Iterator[tuple[Node, Node, Node]]:
+        return self.triples((None, None, None))
+
+    def __contains__(self, triple: tuple[Node, Node, Node]) -> bool:
+        return next(self.triples(triple), None) is not None
+
+    def term_id(self, term: Node) -> Optional[int]:
+        """
+        Get the id of a term.
+        :param term: The term.
+        :return: The id or None if the term is not part of the graph.
+        """
+        return self._ids.get(term)
+
+    def triples(self, triple: tuple[Optional[Node], Optional[Node], Optional[Node]]) \
+            -> Iterator[tuple[Node, Node, Node]]:
+        """
+        Generator over the triples that match the pattern. None is used as a wildcard.
+        """
+        subject, predicate, obj = triple
+        subject_id, predicate_id, object_id = (None if term is None else self._ids.get(term, -1)
+                                               for term in (subject, predicate, obj))
+        if -1 in (subject_id, predicate_id, object_id):
+            return
+
+        if subject_id is not None:
+            start, end = self.offsets[subject_id], self.offsets[subject_id + 1]
+            edges = numpy.arange(start, end)
+        else:
+            edges = numpy.arange(len(self))
+
+        mask = numpy.ones(len(edges), dtype=bool)
+        if predicate_id is not None:
+            mask &= self.predicates_ids[edges] == predicate_id
+        if object_id is not None:
+            mask &= self.objects_ids[edges] == object_id
+        edges = edges[mask]
+
+        # Find the row (subject) of every matching edge.
+        edge_subjects = numpy.searchsorted(self.offsets, edges, side='right') - 1
+        terms = self.terms
+        for edge, edge_subject in zip(edges.tolist(), edge_subjects.tolist()):
+            yield terms[edge_subject], terms[self.predicates_ids[edge]], terms[self.objects_ids[edge]]
+
+    def predicate_objects(self, subject: Optional[Node] = None, unique: bool = False) -> Iterator[tuple[Node, Node]]:
+        """
+        Generator over the (predicate, object) pairs of a subject.
+        """
+        if subject is not None:
+            subject_id = self._ids.get(subject)
+            if subject_id is None:
+                return
+            start, end = self.offsets[subject_id], self.offsets[subject_id + 1]
+            terms = self.terms
+            for predicate_id, object_id in zip(self.predicates_ids[start:end].tolist(),
+                                               self.objects_ids[start:end].tolist()):
+                yield terms[predicate_id], terms[object_id]
+            return
+
+        yield from self._project(self.triples((None, None, None)), (1, 2), unique)
+
+    def subjects(self, predicate: Optional[Node] = None, obj: Optional[Node] = None, unique: bool = False) \
+            -> Iterator[Node]:
+        """
+        Generator over the subjects with the given predicate and object.
+        """
+        for (subject,) in self._project(self.triples((None, predicate, obj)), (0,), unique):
+            yield subject
+
+    def predicates(self, subject: Optional[Node] = None, obj: Optional[Node] = None, unique: bool = False) \
+            -> Iterator[Node]:
+        """
+        Generator over the predicates with the given subject and object.
+        """
+        for (predicate,) in self._project(self.triples((subject, None, obj)), (1,), unique):
+            yield predicate
+
+    def objects(self, subject: Optional[Node] = None, predicate: Optional[Node] = None, unique: bool = False) \
+            -> Iterator[Node]:
+        """
+        Generator over the objects with the given subject and predicate.
+        """
+        for (obj,) in self._project(self.triples((subject, predicate, None)), (2,), unique):
+            yield obj
+
+    def subject_objects(self, predicate: Optional[Node] = None, unique: bool = False) -> Iterator[tuple[Node, Node]]:
+        """
+        Generator over the (subject, object) pairs with the given predicate.
+        """
+        yield from self._project(self.triples((None, predicate, None)), (0, 2), unique)
+
+    @staticmethod
+    def _project(triples, positions: tuple[int, ...], unique: bool):
+        """
+        Helper function used to select parts of triples, optionally removing duplicates.
+        """
+        seen = set()
+        for triple in triples:
+            item = tuple(triple[position] for position in positions)
+            if unique:
+                if item in seen:
+                    continue
+                seen.add(item)
+            yield item
@@ -0,0 +1,106 @@
+import dataclasses
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+
+@dataclass
+class RunManifest:
+    """
+    The progress of a verbalization run, stored as `manifest.json` in the output directory of the run.
+    A root is completed once the partition holding its row has been written (or if it produced no row).
+
+    While the run is in progress, checkpoints are appended to `manifest.log.jsonl` instead of rewriting the manifest,
+    so recording a checkpoint costs as much as the roots it completed. The log is folded back into the manifest when
+    the run finishes.
+    """
+    namespace: str
+    # all the roots of the run, in order, so a resumed run processes the same (sampled) entries.
+    entries: list[str]
+    completed: list[str] = dataclasses.field(default_factory=list)
+    partitions: list[str] = dataclasses.field(default_factory=list)
+    llm_cost: float = 0.0
+    finished: bool = False
+    # the shard of the run, and the position of every entry in the entries of the whole (unsharded) run.
+    shard_index: int = 0
+    shard_count: int = 1
+    positions: list[int] = dataclasses.field(default_factory=list)
+    # the closure fingerprint of every root, when the run was verbalized incrementally (see `PreviousRun`).
+    fingerprints: dict[str, str] = dataclasses.field(default_factory=dict)
+
+    file_name = 'manifest.json'
+    log_name = 'manifest.log.jsonl'
+
+    @classmethod
+    def load(cls, directory: str) -> Optional['RunManifest']:
+        """
+        Load the manifest of a run, including the checkpoints logged since it was last saved.
+        :param directory: The output directory of the run.
+        :return: The manifest or None if the directory does not hold a run.
+        """
+        path = Path(directory) / cls.file_name
+        if not path.exists():
+            return None
+        with open(path, encoding='utf-8') as file:
+            manifest = cls(**json.load(file))
+
+        log_path = Path(directory) / cls.log_name
+        if log_path.exists():
+            with open(log_path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # the last checkpoint was interrupted while being written, its roots are processed again.
+                        break
+                    manifest.completed.extend(record['completed'])
+                    if record['partition'] is not None:
+                        manifest.partitions.append(record['partition'])
+                    manifest.llm_cost = record['llm_cost']
+            # a save interrupted before the log was removed leaves checkpoints that are in the manifest already.
+            manifest.completed = list(dict.fromkeys(manifest.completed))
+            manifest.partitions = list(dict.fromkeys(manifest.partitions))
+        return manifest
+
+    def save(self, directory: str):
+        """
+        Atomically replace the manifest of the run, so an interrupted write never leaves a corrupted manifest behind.
+        The checkpoint log is removed, as the manifest holds its checkpoints.
+        :param directory: The output directory of the run.
+        """
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        path = Path(directory) / self.file_name
+        temp_path = path.with_suffix('.json.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(dataclasses.asdict(self), file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+        (Path(directory) / self.log_name).unlink(missing_ok=True)
+
+    def checkpoint(self, directory: str, completed: list[str], partition: Optional[str], llm_cost: float,
+                   finished: bool = False):
+        """
+        Record the progress of the run. The roots and partition are appended to the checkpoint log, unless the run
+        finished, in which case the log is compacted into the manifest.
+        :param directory: The output directory of the run.
+        :param completed: The roots completed since the last checkpoint.
+        :param partition: The name of the partition written since the last checkpoint, if any.
+        :param llm_cost: The LLM cost of the run so far.
+        :param finished: Whether the run finished.
+        """
+        self.completed.extend(completed)
+        if partition is not None:
+            self.partitions.append(partition)
+        self.llm_cost = llm_cost
+        if finished:
+            self.finished = True
+            self.save(directory)
+            return
+
+        with open(Path(directory) / self.log_name, 'a', encoding='utf-8') as file:
+            file.write(json.dumps({'completed': completed, 'partition': partition, 'llm_cost': llm_cost}) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
@@ -26,9 +26,18 @@ class ParaphraseLanguageModel(ABC):
     @property
     def cost(self) -> float:
         """
-        The usage cost so far of the model.
+        The usage cost so far of the model, including the cost added with `add_cost`. Subclasses that override it
+        should include `super().cost`.
         """
-        return 0.0
+        return getattr(self, '_added_cost', 0.0)
+
+    def add_cost(self, cost: float):
+        """
+        Account for usage of the model that happened elsewhere, e.g. in the worker processes of a parallel run, which
+        use copies of the model.
+        :param cost: The cost to add.
+        """
+        self._added_cost = getattr(self, '_added_cost', 0.0) + cost
 
     @property
     def name(self) -> str:
@@ -167,7 +176,7 @@ class ChatGptModelParaphrase(ParaphraseLanguageModel):
         in_tokens = self._in_token_usage / 1000
         out_tokens = self._out_token_usage / 1000
 
-        return in_tokens * model_pricing['input'] + out_tokens * model_pricing["output"]
+        return super().cost + in_tokens * model_pricing['input'] + out_tokens * model_pricing["output"]
 
     @property
     def name(self) -> str:
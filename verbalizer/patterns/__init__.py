@@ -1,6 +1,9 @@
+import inspect
 from abc import ABC, abstractmethod
 
-from rdflib import Graph
+from typing import Optional
+
+from rdflib import Graph, URIRef
 from rdflib.term import Node
 
 from verbalizer.vocabulary import Vocabulary
@@ -12,27 +15,52 @@ class Pattern(ABC):
     specific concept.
     """
 
+    # The IRIs of the relations that can trigger the pattern. Patterns that declare them are selected by the
+    # verbalizer based on the set of relations of a node only (see `matches`), which allows it to be cached per set of
+    # relations. Patterns that do not declare them are evaluated with `check` for every node.
+    triggers: Optional[frozenset[str]] = None
+
     def __init__(self, graph: Graph, verbalizer: 'Verbalizer', vocabulary: Vocabulary):
         self._graph = graph
         self.verbalizer = verbalizer
         self.vocab = vocabulary
 
-    @abstractmethod
+        # Patterns written against the older contract define `normalize(node, triple_collector)` and query the graph
+        # themselves.
+        self.receives_results = 'results' in inspect.signature(self.normalize).parameters
+
+        self.trigger_relations = None if self.triggers is None else frozenset(URIRef(iri) for iri in self.triggers)
+
     def check(self, results) -> bool:
         """
         The check function is used to determine whether a patterns was detected or not. The "results" argument
         includes the first-degree related objects to the subject. If more triples are needed to be fetched to
         identify the patterns, self.graph.query can be used.
+
+        Patterns that declare `triggers` do not need to implement it, by default it is answered by `matches`.
         """
-        return False
+        if self.trigger_relations is None:
+            return False
+        return self.matches(frozenset(relation for (relation, obj) in results))
+
+    def matches(self, relations: frozenset[URIRef]) -> bool:
+        """
+        Used for patterns that declare `triggers`. Given the set of relations of a node, return whether the pattern
+        was detected. By default, the pattern is detected if any of the triggers is present.
+        """
+        return not self.trigger_relations.isdisjoint(relations)
 
     @abstractmethod
-    def normalize(self, node: 'VerbalizationNode', triple_collector) -> list[tuple[Node, Node]]:
+    def normalize(self, node: 'VerbalizationNode', triple_collector, results) -> list[tuple[Node, Node]]:
         """
         The normalize function is called only if the check returned True. It is used to simplify the patterns. This
         means that the patterns must re-arrange the connected nodes in an order that would be different from the
         regular order. In addition to that, the implementation must also collect all the RDF triples observed
         regardless of whether they were used or not in the construction of the nodes and edges.
+
+        The "results" argument is the same list of first-degree related objects that was passed to `check`, so the
+        pattern does not need to fetch them again. Implementations that do not declare this argument are called
+        without it.
         """
         return []
 
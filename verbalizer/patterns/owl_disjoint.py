@@ -11,20 +11,15 @@ class OwlDisjointWith(Pattern):
     "collection". This results in having one statement for all disjoints.
     """
     disjoint_relation = 'http://www.w3.org/2002/07/owl#disjointWith'
+    triggers = frozenset({disjoint_relation})
 
-    def check(self, results) -> bool:
-        return self.disjoint_relation in {relation.toPython() for (relation, obj) in results}
-
-    def normalize(self, node: VerbalizationNode, triple_collector):
+    def normalize(self, node: VerbalizationNode, triple_collector, results):
 
         # Separate results into two groups: 1) related to disjointness, 2) all other
-        query = self.verbalizer.next_step_query_builder(node)
-        query_results = self._graph.query(query)
+        query_results = results
 
         # create intermediate node
-        intermediate_node = VerbalizationNode(
-            '_', parent_path=node.get_parent_path() + [(node.concept, URIRef(self.disjoint_relation))]
-        )
+        intermediate_node = node.child('_', URIRef(self.disjoint_relation))
         intermediate_node.display = ''
         intermediate_edge = VerbalizationEdge(URIRef(self.disjoint_relation), intermediate_node)
         intermediate_edge.display = self.vocab.get_relationship_label(self.disjoint_relation)
@@ -32,7 +27,7 @@ class OwlDisjointWith(Pattern):
         for (relation, obj) in query_results:
             if relation != URIRef(self.disjoint_relation):
                 continue
-            next_node = VerbalizationNode(obj, parent_path=node.get_parent_path() + [(node.concept, relation)])
+            next_node = node.child(obj, relation)
             next_node.display = self.vocab.get_class_label(obj)
             edge = VerbalizationEdge(URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#collection'), next_node)
             edge.display = '#collection'
@@ -50,7 +45,7 @@ class OwlDisjointWith(Pattern):
                     triple_collector.append((node.concept, relation, obj))
                 continue
 
-            next_node = VerbalizationNode(obj, parent_path=node.get_parent_path() + [(node.concept, relation)])
+            next_node = node.child(obj, relation)
             edge = VerbalizationEdge(relation, next_node)
             node.add_edge(edge)
             edge.display = relation_display
@@ -1,40 +1,61 @@
 from verbalizer.patterns import Pattern
 from rdflib import URIRef
 
-from verbalizer.verbalizer import VerbalizationNode, VerbalizationEdge
+from verbalizer.verbalizer import VerbalizationNode, VerbalizationEdge, VerbalizationError, VerbalizationPath
 
 
 class OwlFirstRestPattern(Pattern):
     """
     Pattern that handles ordered lists (first-rest) in OWL.
     """
+    first_relation = URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#first')
+    rest_relation = URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#rest')
+    nil = URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#nil')
 
-    def check(self, results) -> bool:
-        expected = {'http://www.w3.org/1999/02/22-rdf-syntax-ns#first',
-                    'http://www.w3.org/1999/02/22-rdf-syntax-ns#rest'}
-        return {relation.toPython() for (relation, obj) in results} == expected
-
-    def normalize(self, node: VerbalizationNode, triple_collector):
-        current = node
-        while current.concept != URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#nil'):
-            query = self.verbalizer.next_step_query_builder(current)
-            results = self._graph.query(query)
-            rest_node = None
+    triggers = frozenset({
+        'http://www.w3.org/1999/02/22-rdf-syntax-ns#first',
+        'http://www.w3.org/1999/02/22-rdf-syntax-ns#rest'
+    })
+
+    def matches(self, relations) -> bool:
+        return relations == self.trigger_relations
+
+    def normalize(self, node: VerbalizationNode, triple_collector, results):
+        # The list is walked cell by cell following rdf:rest. Every cell is looked up directly by its identity, and the
+        # path of a cell extends the path of the previous one without copying it, so a list of N elements costs N
+        # lookups.
+        visited = set()
+        cell = node.concept
+        cell_path = node.parent_path
+        while True:
+            visited.add(cell)
+            rest = None
             for (relation, obj) in results:
-                next_node = VerbalizationNode(
-                    obj, parent_path=current.get_parent_path() + [(current.concept, relation)]
-                )
-                if relation == URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#first'):
-                    # first
+                triple_collector.append((cell, relation, obj))
+
+                if relation == self.first_relation:
+                    next_node = VerbalizationNode(obj, parent_path=VerbalizationPath(cell_path, (cell, relation)),
+                                                  context=node.context)
                     edge = VerbalizationEdge(URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#collection'), next_node)
                     node.add_edge(edge)
                     edge.display = '#collection'
-                else:
-                    # rest
-                    rest_node = next_node
-                triple_collector.append((current.concept, relation, obj))
+                elif relation == self.rest_relation:
+                    if rest is not None:
+                        raise VerbalizationError(f'Malformed list at {node.concept}: {cell} has more than one rdf:rest.')
+                    rest = obj
+
+            if rest is None:
+                raise VerbalizationError(f'Malformed list at {node.concept}: {cell} has no rdf:rest.')
+
+            if rest == self.nil:
+                break
+
+            if rest in visited:
+                raise VerbalizationError(f'Malformed list at {node.concept}: the rdf:rest of {cell} forms a cycle.')
 
-            current = rest_node
+            cell_path = VerbalizationPath(cell_path, (cell, self.rest_relation))
+            cell = rest
+            results = self.verbalizer.next_step(VerbalizationNode(cell, context=node.context))
 
         return [(reference.relationship, reference.node.concept) for reference in node.references]
 
@@ -9,28 +9,24 @@ class OwlRestrictionPattern(Pattern):
     Pattern that handles restrictions
     """
 
-    def check(self, results) -> bool:
-        expected = {
-            'http://www.w3.org/2002/07/owl#onProperty',
-            'http://www.w3.org/2002/07/owl#someValuesFrom',
-            'http://www.w3.org/2002/07/owl#allValuesFrom',
-            'http://www.w3.org/2002/07/owl#hasValue',
-            'http://www.w3.org/2002/07/owl#cardinality',
-            'http://www.w3.org/2002/07/owl#minCardinality',
-            'http://www.w3.org/2002/07/owl#maxCardinality',
-            'http://www.w3.org/2002/07/owl#qualifiedCardinality',
-            'http://www.w3.org/2002/07/owl#minQualifiedCardinality',
-            'http://www.w3.org/2002/07/owl#maxQualifiedCardinality',
-            'http://www.w3.org/2002/07/owl#onClass'
-        }
-        actual = {relation.toPython() for (relation, obj) in results}
-
-        return len(expected.intersection(actual)) >= 2
-
-    def normalize(self, node: VerbalizationNode, triple_collector):
-        query = self.verbalizer.next_step_query_builder(node)
-        results = self._graph.query(query)
-
+    triggers = frozenset({
+        'http://www.w3.org/2002/07/owl#onProperty',
+        'http://www.w3.org/2002/07/owl#someValuesFrom',
+        'http://www.w3.org/2002/07/owl#allValuesFrom',
+        'http://www.w3.org/2002/07/owl#hasValue',
+        'http://www.w3.org/2002/07/owl#cardinality',
+        'http://www.w3.org/2002/07/owl#minCardinality',
+        'http://www.w3.org/2002/07/owl#maxCardinality',
+        'http://www.w3.org/2002/07/owl#qualifiedCardinality',
+        'http://www.w3.org/2002/07/owl#minQualifiedCardinality',
+        'http://www.w3.org/2002/07/owl#maxQualifiedCardinality',
+        'http://www.w3.org/2002/07/owl#onClass'
+    })
+
+    def matches(self, relations) -> bool:
+        return len(self.trigger_relations.intersection(relations)) >= 2
+
+    def normalize(self, node: VerbalizationNode, triple_collector, results):
         next_node = None
         quantifier_relation = None
         property_relation = None
@@ -50,8 +46,7 @@ class OwlRestrictionPattern(Pattern):
                                        'http://www.w3.org/2002/07/owl#allValuesFrom',
                                        'http://www.w3.org/2002/07/owl#hasValue'}:
                 quantifier_relation = relation
-                next_node = VerbalizationNode(concept=obj,
-                                              parent_path=node.get_parent_path() + [(node.concept, relation)])
+                next_node = node.child(obj, relation)
 
             if relation.toPython() in {'http://www.w3.org/2002/07/owl#cardinality',
                                        'http://www.w3.org/2002/07/owl#minCardinality',
@@ -65,20 +60,14 @@ class OwlRestrictionPattern(Pattern):
 
                 # initialize next_node only if it hasn't been initialized yet.
                 if next_node is None:
-                    next_node = VerbalizationNode(
-                        concept='',
-                        parent_path=node.get_parent_path() + [(node.concept, relation)]
-                    )
+                    next_node = node.child('', relation)
                     next_node.display = ''
 
             if relation.toPython() in {
                 'http://www.w3.org/2002/07/owl#onClass'
             }:
                 on_class = obj
-                next_node = VerbalizationNode(
-                    concept=obj,
-                    parent_path=node.get_parent_path() + [(node.concept, relation)]
-                )
+                next_node = node.child(obj, relation)
                 next_node.display = ''
 
             triple_collector.append((node.concept, relation, obj))
@@ -1,19 +1,63 @@
 import datetime
+import functools
+import itertools
+import json
 import logging
+import multiprocessing
+import pickle
+import signal
+import threading
+from collections import deque
 from pathlib import Path
-from typing import Optional
-from xml.sax import SAXParseException
+from typing import Iterable, Iterator, Optional
 
-import pandas
-from rdflib import Graph, URIRef
+from rdflib import Graph, URIRef, Literal
+from rdflib import RDF, OWL
 from tqdm import tqdm
 
+from verbalizer.incremental import PreviousRun
+from verbalizer.index import GraphIndex
+from verbalizer.manifest import RunManifest
 from verbalizer.nlp import ParaphraseLanguageModel
 from verbalizer.sampler import Sampler
-from verbalizer.verbalizer import Verbalizer
+from verbalizer.shards import shard_of
+from verbalizer.sinks import OutputSink, CsvSink
+from verbalizer.snapshot import load_graph
+from verbalizer.timings import TimingSummary
+from verbalizer.verbalizer import Verbalizer, VerbalizerInstanceStats
 
 logger = logging.getLogger(__name__)
 
+# The verbalizer of a worker process, set once when the worker starts.
+_worker_verbalizer: Optional[Verbalizer] = None
+
+
+def _init_worker(verbalizer: Verbalizer):
+    global _worker_verbalizer
+    _worker_verbalizer = verbalizer
+    # forked workers inherit the handler that flushes the run, which only the parent process may do.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _verbalize_entry(entry: URIRef) -> tuple[str, str, str, VerbalizerInstanceStats, float]:
+    """
+    Verbalize a single entry with the verbalizer of the worker.
+    :return: (fragment, CNL text, LLM text, stats, LLM cost of this entry)
+    """
+    return _verbalize_entry_with(_worker_verbalizer, entry)
+
+
+def _verbalize_entry_with(verbalizer: Verbalizer, entry: URIRef) -> tuple[str, str, str, VerbalizerInstanceStats, float]:
+    llm = verbalizer.llm
+    cost = llm.cost if llm else 0.0
+    fragment, text, llm_text, stats = verbalizer.verbalize(entry)
+    return fragment, text, llm_text, stats, (llm.cost - cost if llm else 0.0)
+
+
+def _exit_on_sigterm(signum, frame):
+    # turns SIGTERM into an exception, so the current chunk is flushed on the way out.
+    raise SystemExit(128 + signum)
+
 
 class Processor:
     """
@@ -28,14 +72,28 @@ class Processor:
                        output_dir: Optional[str] = None,
                        chunk_size: int = 1000,
                        sampler: Optional[Sampler] = None,
-                       as_generator: bool = False):
+                       as_generator: bool = False,
+                       workers: int = 1,
+                       sink: Optional[OutputSink] = None,
+                       run_id: Optional[str] = None,
+                       previous_run: Optional[PreviousRun] = None,
+                       entity_types: Optional[Iterable[URIRef]] = None,
+                       shard_index: int = 0,
+                       shard_count: int = 1):
         gen = cls.verbalize_with_stream(
             verbalizer,
             namespace=namespace,
             output_dir=output_dir,
             chunk_size=chunk_size,
             sampler=sampler,
-            as_generator=as_generator
+            as_generator=as_generator,
+            workers=workers,
+            sink=sink,
+            run_id=run_id,
+            previous_run=previous_run,
+            entity_types=entity_types,
+            shard_index=shard_index,
+            shard_count=shard_count
         )
         if as_generator:
             return gen
@@ -51,7 +109,14 @@ class Processor:
             output_dir: Optional[str] = None,
             chunk_size: int = 1000,
             sampler: Optional[Sampler] = None,
-            as_generator: bool = False):
+            as_generator: bool = False,
+            workers: int = 1,
+            sink: Optional[OutputSink] = None,
+            run_id: Optional[str] = None,
+            previous_run: Optional[PreviousRun] = None,
+            entity_types: Optional[Iterable[URIRef]] = None,
+            shard_index: int = 0,
+            shard_count: int = 1):
         """
         Start the verbalization process.
         :param verbalizer: The verbalizer to use.
@@ -60,140 +125,330 @@ class Processor:
         :param chunk_size: Number of entries (rows) per file. default = 1000
         :param sampler: A sampling configuration, use to sample large ontologies.
         :param as_generator: If True, returns a generator instead of a list.
+        :param workers: Number of processes to verbalize with. The entries are sharded across a process pool and the
+        results are returned in the same order as with a single process. The cost of the language model in the workers
+        is added to the one of the verbalizer. Where processes cannot be forked, the verbalizer, including its language
+        model, is pickled to start the workers. default = 1
+        :param sink: How the chunks are written to the output directory. default = CSV files
+        :param run_id: Name of the run directory. default = the current timestamp.
+        If the directory holds an interrupted run, that run is resumed: the roots it completed are skipped and only the
+        rows of the remaining roots are returned.
+        :param previous_run: A run of an earlier version of the ontology. The rows of the roots whose closure did not
+        change are carried forward from it instead of being verbalized again.
+        :param entity_types: The types of the entities to verbalize, e.g. owl:ObjectProperty or rdfs:Datatype.
+        default = owl:Class and owl:NamedIndividual
+        :param shard_index: The shard to verbalize, when the run is split across several hosts. The roots are assigned
+        to shards by a stable hash of their IRI, after sampling, and the shards can be combined with `merge_shards`.
+        Every host samples the whole ontology, so a sampled run must use a streaming sampler, whose sample depends on
+        the seed and the entities only, not on the order they are enumerated in. The merged dataset is then in the order
+        of the sample. Without a sampler, it is in the order the entities are enumerated in on the hosts.
+        :param shard_count: Number of shards the run is split into. default = 1
         """
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f'shard_index must be between 0 and {shard_count - 1}')
+        if shard_count > 1 and sampler and not sampler.streaming:
+            raise ValueError('A sharded run requires a streaming sampler, so that every shard samples the same entities')
+        if workers > 1:
+            cls._check_pool_support(verbalizer)
 
         # current timestamp
         now = datetime.datetime.now(datetime.UTC)
         timestamp = int(now.timestamp())
         llm: ParaphraseLanguageModel = verbalizer.llm
+        run_id = run_id or str(timestamp)
 
         # make output directory
         if output_dir:
             if llm:
-                out = f'{output_dir}/{namespace}/{llm.name}/{timestamp}'
+                out = f'{output_dir}/{namespace}/{llm.name}/{run_id}'
             else:
-                out = f'{output_dir}/{namespace}/{timestamp}'
+                out = f'{output_dir}/{namespace}/{run_id}'
+            if shard_count > 1:
+                out = f'{out}/shard_{shard_index}_of_{shard_count}'
         else:
             out = None
 
-        classes = cls._get_classes(verbalizer.graph)
-        individuals = cls._get_individuals(verbalizer.graph)
+        sink = sink or CsvSink()
+        sink_open = False
+        sink_path = None
+
+        manifest = RunManifest.load(out) if out else None
+        if manifest:
+            # the entries of the run are restored from the manifest, so a sampled run resumes with the same sample.
+            completed = set(manifest.completed)
+            entries = [URIRef(entry) for entry in manifest.entries if entry not in completed]
+            logger.info(f'Resuming run {out}, {len(entries)} of {len(manifest.entries)} entries left')
+            # compact the checkpoint log of the interrupted run, which may end with a partially written checkpoint.
+            manifest.save(out)
+        else:
+            if entity_types is None:
+                types = {'classes': OWL.Class, 'individuals': OWL.NamedIndividual}
+            else:
+                types = {str(rdf_type): rdf_type for rdf_type in entity_types}
+
+            if sampler:
+                # a streaming sampler samples the entities as they are enumerated, so they are never held in memory.
+                entities = sampler.get_sample({
+                    key: functools.partial(cls.iter_entities, verbalizer.graph, rdf_type)
+                    for key, rdf_type in types.items()
+                })
+            else:
+                entities = {
+                    key: list(tqdm(cls.iter_entities(verbalizer.graph, rdf_type), desc=f'Loading {key}'))
+                    for key, rdf_type in types.items()
+                }
+
+            # an entity with several of the types is verbalized once.
+            entries = list(dict.fromkeys(itertools.chain.from_iterable(entities.values())))
+
+            positions = []
+            if shard_count > 1:
+                shard = [(position, entry) for position, entry in enumerate(entries)
+                         if shard_of(entry, shard_count) == shard_index]
+                positions = [position for position, _ in shard]
+                entries = [entry for _, entry in shard]
+                logger.info(f'Shard {shard_index} of {shard_count} holds {len(entries)} entries')
+
+            if out:
+                manifest = RunManifest(namespace=namespace, entries=[str(entry) for entry in entries],
+                                       shard_index=shard_index, shard_count=shard_count, positions=positions)
+                manifest.save(out)
 
-        if sampler := sampler:
-            samples = sampler.get_sample({'classes': classes, 'individuals': individuals})
-            classes, individuals = samples['classes'], samples['individuals']
         full_dataset = []
         chunk_dataset = []
+        # roots that were processed since the last checkpoint.
+        pending_roots = []
+
+        partition = len(manifest.partitions) if manifest else 0
+        llm_cost = manifest.llm_cost if manifest else 0.0
 
-        partition = 0
-        for entry in tqdm(classes + individuals, desc='Verbalizing'):
-            fragment, text, llm_text, stats = verbalizer.verbalize(entry)
+        def checkpoint(finished: bool = False):
+            """
+            Close the current partition and record the progress of the run in the manifest.
+            """
+            nonlocal sink_open
+            partition_name = None
+            if sink_open:
+                sink.close()
+                sink_open = False
+                partition_name = Path(sink_path).name
+            manifest.checkpoint(out, list(pending_roots), partition_name, llm_cost, finished=finished)
+            pending_roots.clear()
 
-            if stats.statements == 0:
-                continue
+        # signal handlers can only be installed from the main thread. In generator mode the handler of the caller is
+        # restored while the generator is suspended, so a SIGTERM received then is handled by the caller.
+        handle_sigterm = manifest is not None and threading.current_thread() is threading.main_thread()
+        previous_handler = signal.signal(signal.SIGTERM, _exit_on_sigterm) if handle_sigterm else None
+        if previous_handler is None:
+            previous_handler = signal.SIG_DFL
 
-            element = {
-                'ontology': namespace,
-                'root': entry,
-                'fragment': fragment,
-                'text': text,
-                'llm_text': llm_text,
-                'model': llm.name if llm else 'None',
-                'statements': stats.statements,
-                'unique_concepts': len(stats.concepts),
-                'unique_relationships': len(stats.relationship_counter),
-                'total_relationships': sum(stats.relationship_counter.values()),
-                **stats.relationship_counter
-            }
+        timings = TimingSummary()
+        label_cache_hits = label_cache_misses = 0
+        carried = {}
+        if previous_run:
+            fingerprints = {}
+            carried = previous_run.carry_forward(verbalizer, entries, fingerprints if manifest else None)
+            if manifest:
+                manifest.fingerprints.update(fingerprints)
+        results = cls._verbalize_entries(verbalizer, [entry for entry in entries if entry not in carried], workers)
+        try:
+            for entry in tqdm(entries, desc='Verbalizing'):
+                if entry in carried:
+                    carried_row = carried.pop(entry)
+                    if carried_row is None:
+                        pending_roots.append(str(entry))
+                        continue
+                    row, relationships = carried_row
+                    row = {**row, 'ontology': namespace}
+                else:
+                    fragment, text, llm_text, stats, cost = next(results)
+                    llm_cost += cost
+                    label_cache_hits += stats.label_cache_hits
+                    label_cache_misses += stats.label_cache_misses
+                    if stats.timings:
+                        timings.add(stats.timings, stats.graph_accesses)
 
-            chunk_dataset.append(element)
+                    if stats.statements == 0:
+                        pending_roots.append(str(entry))
+                        continue
 
-            if as_generator:
-                yield element
+                    row = {
+                        'ontology': namespace,
+                        'root': entry,
+                        'fragment': fragment,
+                        'text': text,
+                        'llm_text': llm_text,
+                        'model': llm.name if llm else 'None',
+                        'statements': stats.statements,
+                        'unique_concepts': len(stats.concepts),
+                        'unique_relationships': len(stats.relationship_counter),
+                        'total_relationships': sum(stats.relationship_counter.values()),
+                    }
+                    relationships = stats.relationship_counter
+                element = {**row, **relationships}
 
-            if len(chunk_dataset) != chunk_size:
-                continue
+                # rows are written as they come, the sink decides how to buffer them.
+                if out:
+                    if not sink_open:
+                        Path(out).mkdir(parents=True, exist_ok=True)
+                        sink_path = f'{out}/file_{partition}.{sink.extension}'
+                        sink.open(sink_path)
+                        sink_open = True
+                    sink.write(row, relationships)
+                pending_roots.append(str(entry))
 
-            full_dataset.extend(chunk_dataset)
+                chunk_dataset.append(element)
 
-            if out:
-                Path(out).mkdir(parents=True, exist_ok=True)
-                pandas.DataFrame(chunk_dataset).to_csv(f'{out}/file_{partition}.csv', index=False)
+                if as_generator:
+                    if handle_sigterm:
+                        signal.signal(signal.SIGTERM, previous_handler)
+                    yield element
+                    if handle_sigterm:
+                        signal.signal(signal.SIGTERM, _exit_on_sigterm)
 
-            partition += 1
-            chunk_dataset = []
+                if len(chunk_dataset) != chunk_size:
+                    continue
 
-        # handle leftovers
-        if chunk_dataset:
-            full_dataset.extend(chunk_dataset)
-            if out:
-                Path(out).mkdir(parents=True, exist_ok=True)
-                pandas.DataFrame(chunk_dataset).to_csv(f'{out}/file_{partition}.csv', index=False)
+                # In generator mode the rows are handed over to the caller, so only the current chunk is kept in
+                # memory.
+                if not as_generator:
+                    full_dataset.extend(chunk_dataset)
+
+                if manifest:
+                    checkpoint()
+
+                partition += 1
+                chunk_dataset = []
+
+            # handle leftovers
+            if chunk_dataset and not as_generator:
+                full_dataset.extend(chunk_dataset)
+            if manifest:
+                checkpoint(finished=True)
+        finally:
+            # on errors, interruptions and SIGTERM the partial chunk is flushed, so the run can be resumed from it.
+            if manifest and not manifest.finished:
+                checkpoint()
+            results.close()
+            if handle_sigterm:
+                signal.signal(signal.SIGTERM, previous_handler)
 
         logger.info('Finished verbalizing')
         if llm:
-            logger.info(f'LLM usage cost: ${llm.cost}')
+            logger.info(f'LLM usage cost: ${llm_cost}')
+        if label_cache_hits + label_cache_misses:
+            logger.info(f'Label cache hit rate: {label_cache_hits / (label_cache_hits + label_cache_misses):.1%} '
+                        f'({label_cache_hits} hits, {label_cache_misses} misses)')
+
+        if timings:
+            summary = timings.summary()
+            for stage, values in summary.items():
+                logger.info(f'{stage}: p50={values["p50"]:.6f} p95={values["p95"]:.6f} p99={values["p99"]:.6f} '
+                            f'total={values["total"]:.3f}')
+            if out:
+                Path(out).mkdir(parents=True, exist_ok=True)
+                with open(f'{out}/timings.json', 'w', encoding='utf-8') as file:
+                    json.dump(summary, file, indent=2)
 
         if not as_generator:
             yield full_dataset
 
+    @staticmethod
+    def _verbalize_entries(verbalizer: Verbalizer, entries: Iterable[URIRef], workers: int) \
+            -> Iterator[tuple[str, str, str, VerbalizerInstanceStats, float]]:
+        """
+        Verbalize the entries, in order, either in the current process or in a pool of worker processes.
+        Workers are forked when the platform supports it, so they inherit the graph and vocabulary. Otherwise, the
+        verbalizer is sent to every worker once, when it starts.
+        :return: Generator of (fragment, CNL text, LLM text, stats, LLM cost) per entry.
+        """
+        if workers <= 1:
+            for entry in entries:
+                yield _verbalize_entry_with(verbalizer, entry)
+            return
+
+        def collect(result):
+            # the workers use copies of the language model, so their cost is added to the one of the caller.
+            if verbalizer.llm:
+                verbalizer.llm.add_cost(result[4])
+            return result
+
+        # At most `window` entries are in flight, so results do not pile up when the caller consumes them slowly.
+        window = workers * 4
+        pending = deque()
+        with Processor._pool_context().Pool(workers, initializer=_init_worker, initargs=(verbalizer,)) as pool:
+            for entry in entries:
+                pending.append(pool.apply_async(_verbalize_entry, (entry,)))
+                if len(pending) >= window:
+                    yield collect(pending.popleft().get())
+
+            while pending:
+                yield collect(pending.popleft().get())
+
+    @staticmethod
+    def _pool_context():
+        """
+        The multiprocessing context of the worker pool. Workers are forked when the platform supports it.
+        """
+        if 'fork' in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context('fork')
+        return multiprocessing.get_context()
+
+    @staticmethod
+    def _check_pool_support(verbalizer: Verbalizer):
+        """
+        Fail before the run starts if the verbalizer cannot be sent to the workers of the pool. Forked workers inherit
+        it, otherwise it is pickled, which most API clients of language models do not support.
+        """
+        if Processor._pool_context().get_start_method() == 'fork' or not verbalizer.llm:
+            return
+        try:
+            pickle.dumps(verbalizer.llm)
+        except Exception as error:
+            raise ValueError(f'The language model {verbalizer.llm.name} cannot be pickled, which is required to start '
+                             f'worker processes on this platform. Use workers=1 instead.') from error
+
+    @staticmethod
+    def iter_entities(graph: Graph | GraphIndex, rdf_type: URIRef) -> Iterator[URIRef]:
+        """
+        Lazily enumerate the named entities of a type. Every entity is yielded once, and deprecated entities are
+        skipped.
+        :param graph: The ontology, or its index.
+        :param rdf_type: The type of the entities, e.g. owl:Class or owl:ObjectProperty.
+        :return: Generator of URIRef objects.
+        """
+        deprecated = set(graph.subjects(OWL.deprecated, Literal(True)))
+        for subject in graph.subjects(RDF.type, rdf_type, unique=True):
+            if isinstance(subject, URIRef) and subject not in deprecated:
+                yield subject
+
     @staticmethod
     def _get_classes(graph):
         """
-        Get all owl:Class and their labels.
+        Get all owl:Class.
         :param graph: The ontology.
         :return: A list of URIRef objects.
         """
-        query = """
-                SELECT ?o ?label
-                WHERE {
-                    ?o a owl:Class .
-                    OPTIONAL {
-                        ?o rdfs:label ?label
-                    }
-                    FILTER NOT EXISTS {
-                        ?o owl:deprecated true
-                    }
-                }
-            """
-        return [result[0] for result in
-                tqdm(graph.query(query), desc='Loading Classes') if isinstance(result[0], URIRef)]
+        return list(tqdm(Processor.iter_entities(graph, OWL.Class), desc='Loading Classes'))
 
     @staticmethod
     def _get_individuals(graph):
         """
-        Get all owl:NamedIndividual and their labels.
+        Get all owl:NamedIndividual.
         :param graph: The ontology.
         :return: A list of URIRef objects.
         """
-        query = """
-                        SELECT ?o ?label
-                        WHERE {
-                            ?o a owl:NamedIndividual .
-                            OPTIONAL {
-                                ?o rdfs:label ?label
-                            }
-                            FILTER NOT EXISTS {
-                                ?o owl:deprecated true
-                            }
-                        }
-                    """
-        return [result[0] for result in
-                tqdm(graph.query(query), desc='Loading Instances') if isinstance(result[0], URIRef)]
+        return list(tqdm(Processor.iter_entities(graph, OWL.NamedIndividual), desc='Loading Instances'))
 
     @staticmethod
-    def from_file(file_path: str) -> Graph:
+    def from_file(file_path: str, cache_dir: Optional[str] = None) -> Graph:
         """
         Helper function to load graph from file.
+        :param file_path: The path of the file. The format (RDF/XML or Turtle/N3) is detected from its content.
+        :param cache_dir: If set, a binary snapshot of the graph is kept in this directory, keyed by the hash of the
+        file, and later loads read the snapshot instead of parsing the file again.
         """
-        graph = Graph()
-        formats = ['xml', 'n3']
         logger.info(f'Loading File {file_path}')
-        for file_format in formats:
-            try:
-                graph.parse(file_path, format=file_format)
-                break
-            except SAXParseException:
-                pass
+        graph = load_graph(file_path, cache_dir)
         logger.info(f'Done Loading.')
         return graph
@@ -1,13 +1,26 @@
+import bisect
+import hashlib
+import heapq
 import random
+from collections import Counter, defaultdict
+from typing import Callable, Hashable, Iterable, Optional
+
+from rdflib import URIRef
 
 
 class Sampler:
 
-    def __init__(self, *, sample_percentage: float = None, sample_n=None, seed=None):
+    def __init__(self, *, sample_percentage: float = None, sample_n=None, seed=None, streaming: bool = False,
+                 stratify_by: Optional[Callable[[URIRef], Hashable]] = None):
         """
         Can only specify one of these parameters
         :param sample_percentage: The percentage of each list to sample (0 < sample_percentage <= 1)
         :param sample_n: The number of items to sample from each list (sample_n > 0)
+        :param streaming: If True, the items are sampled as they are enumerated, with a reservoir, instead of being
+        collected into a list first. The sizes of the samples are the same, but not the sampled items.
+        :param stratify_by: Function that assigns each item to a stratum, e.g. `Sampler.by_namespace`. If set, the size
+        of the sample of a list is the same, but it is split across the strata of the list in proportion to their sizes,
+        and every stratum is sampled as if it was a list of its own. Implies streaming.
         """
         if (sample_percentage is None) == (sample_n is None):
             raise ValueError("Exactly one of sample_percentage or sample_n must be specified")
@@ -22,17 +35,31 @@ class Sampler:
 
         self.sample_percentage = sample_percentage
         self.sample_n = sample_n
+        self.streaming = streaming or stratify_by is not None
+        self.stratify_by = stratify_by
         self.random_gen = random.Random(seed)
+        # key of the priorities used by the streaming sampling, derived from the seed.
+        self._priority_key = random.Random(seed).getrandbits(128).to_bytes(16, 'big')
 
-    def get_sample(self, items: dict[str, list]) -> dict[str, list]:
+    def get_sample(self, items: dict[str, list | Callable[[], Iterable]]) -> dict[str, list]:
         """
         Given a dictionary where the key is list id, and the value is a list,
         return a new dictionary with a sampled list per key based on the sampling configuration.
+
+        Instead of a list, a value can be a function that returns an iterator over the items. When streaming, the
+        items are then sampled as they are enumerated and only the sample is kept in memory.
         """
 
         sampled_dict = {}
 
         for key, value_list in items.items():
+            if self.streaming:
+                sampled_dict[key] = self._sample_stream(value_list if callable(value_list) else lambda: value_list)
+                continue
+
+            if callable(value_list):
+                value_list = list(value_list())
+
             if self.sample_percentage is not None:
                 n_samples = int(len(value_list) * self.sample_percentage)
             else:
@@ -41,3 +68,86 @@ class Sampler:
             sampled_dict[key] = self.random_gen.sample(value_list, n_samples)
 
         return sampled_dict
+
+    def _sample_stream(self, stream: Callable[[], Iterable]) -> list:
+        """
+        Sample a stream of items with bottom-k (priority) sampling: every item gets a pseudo-random priority derived
+        from the seed and the item itself, and the items with the lowest priorities are kept. This is a reservoir that
+        selects the same items regardless of the order of the stream.
+        A percentage or strata require the number of items, so the stream is read twice in those cases.
+        :param stream: Function that returns an iterator over the items.
+        :return: The sampled items, ordered by priority.
+        """
+        stratum_of = self.stratify_by or (lambda item: None)
+
+        if self.sample_percentage is not None or self.stratify_by:
+            counts = Counter(stratum_of(item) for item in stream())
+            total = sum(counts.values())
+            if self.sample_percentage is not None:
+                sizes = self._allocate(counts, int(total * self.sample_percentage))
+            else:
+                sizes = self._allocate(counts, min(self.sample_n, total))
+        else:
+            sizes = defaultdict(lambda: self.sample_n)
+
+        # a max-heap of the lowest priorities, per stratum.
+        reservoirs = defaultdict(list)
+        for item in stream():
+            stratum = stratum_of(item)
+            size = sizes[stratum]
+            if size == 0:
+                continue
+
+            entry = (-self._priority(item), item)
+            reservoir = reservoirs[stratum]
+            if len(reservoir) < size:
+                heapq.heappush(reservoir, entry)
+            elif entry > reservoir[0]:
+                heapq.heapreplace(reservoir, entry)
+
+        sample = [entry for reservoir in reservoirs.values() for entry in reservoir]
+        return [item for _, item in sorted(sample, reverse=True)]
+
+    @staticmethod
+    def _allocate(counts: Counter, size: int) -> dict[Hashable, int]:
+        """
+        Split the size of a sample across strata in proportion to their number of items, using the largest remainders.
+        :param counts: The number of items per stratum.
+        :param size: The size of the sample.
+        :return: The size of the sample of every stratum, which add up to `size`.
+        """
+        total = sum(counts.values())
+        if not total:
+            return {}
+        quotas = {stratum: count * size / total for stratum, count in counts.items()}
+        sizes = {stratum: int(quota) for stratum, quota in quotas.items()}
+        # strata are ordered by their name on ties, so the split does not depend on the order of the items.
+        by_remainder = sorted(quotas, key=lambda stratum: (sizes[stratum] - quotas[stratum], str(stratum)))
+        for stratum in by_remainder[:size - sum(sizes.values())]:
+            sizes[stratum] += 1
+        return sizes
+
+    def _priority(self, item) -> int:
+        digest = hashlib.blake2b(str(item).encode(), key=self._priority_key, digest_size=8)
+        return int.from_bytes(digest.digest(), 'big')
+
+    @staticmethod
+    def by_namespace(item: URIRef) -> str:
+        """
+        Stratify by the namespace of an IRI, i.e. everything up to the last '#' or '/'.
+        """
+        cut = max(item.rfind('#'), item.rfind('/'))
+        return item[:cut + 1]
+
+    @staticmethod
+    def by_out_degree(graph, bounds: tuple[int, ...] = (1, 4, 16, 64)) -> Callable[[URIRef], int]:
+        """
+        Stratify by the number of outgoing relationships of an entity.
+        :param graph: The ontology, or its index.
+        :param bounds: The lower bound of every bucket but the first.
+        :return: A function that maps an entity to the index of its bucket.
+        """
+        def bucket(item: URIRef) -> int:
+            return bisect.bisect_right(bounds, sum(1 for _ in graph.predicate_objects(item)))
+
+        return bucket
@@ -0,0 +1,93 @@
+import hashlib
+import heapq
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Iterator, Optional
+
+from verbalizer.manifest import RunManifest
+from verbalizer.sinks import OutputSink, CsvSink, read_partition
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(root: str, shard_count: int) -> int:
+    """
+    Assign a root to a shard by a stable hash of its IRI, so the assignment does not depend on the process, the
+    enumeration order or the sampling.
+    :param root: The IRI of the root.
+    :param shard_count: Number of shards.
+    :return: The index of the shard.
+    """
+    digest = hashlib.sha1(str(root).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shard_count
+
+
+def merge_shards(shard_dirs: list[str], output_dir: str, chunk_size: int = 1000,
+                 sink: Optional[OutputSink] = None) -> RunManifest:
+    """
+    Merge the output directories of the shards of a run into a single partitioned dataset. The rows are put back in
+    the order of the whole run, the LLM costs are summed, and a manifest of the merged run is written to the output
+    directory.
+    :param shard_dirs: The output directories of every shard of the run.
+    :param output_dir: The directory of the merged dataset.
+    :param chunk_size: Number of rows per partition. default = 1000
+    :param sink: How the partitions are written. default = CSV files
+    :return: The manifest of the merged run.
+    """
+    if not shard_dirs:
+        raise ValueError('No shards to merge')
+
+    manifests = []
+    for shard_dir in shard_dirs:
+        manifest = RunManifest.load(shard_dir)
+        if manifest is None:
+            raise ValueError(f'{shard_dir} does not hold a verbalization run')
+        if not manifest.finished:
+            raise ValueError(f'The run in {shard_dir} is not finished')
+        manifests.append(manifest)
+
+    shard_count = manifests[0].shard_count
+    if sorted(manifest.shard_index for manifest in manifests) != list(range(shard_count)) \
+            or any(manifest.shard_count != shard_count for manifest in manifests):
+        raise ValueError(f'Expected the directories of the {shard_count} shards of a single run')
+    if len({manifest.namespace for manifest in manifests}) != 1:
+        raise ValueError('The shards belong to different ontologies')
+
+    def positioned_rows(shard_dir: str, manifest: RunManifest) -> Iterator[tuple[int, dict, Counter]]:
+        positions = dict(zip(manifest.entries, manifest.positions or range(len(manifest.entries))))
+        for partition in manifest.partitions:
+            for row, relationships in read_partition(str(Path(shard_dir) / partition)):
+                yield positions[str(row['root'])], row, relationships
+
+    merged = RunManifest(
+        namespace=manifests[0].namespace,
+        entries=[entry for _, entry in sorted(
+            (position, entry) for manifest in manifests
+            for entry, position in zip(manifest.entries, manifest.positions or range(len(manifest.entries)))
+        )],
+        llm_cost=sum(manifest.llm_cost for manifest in manifests)
+    )
+    merged.completed = list(merged.entries)
+
+    # every shard is in the order of the whole run already, so the shards are interleaved as they are read.
+    sink = sink or CsvSink()
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    rows = 0
+    streams = [positioned_rows(shard_dir, manifest) for shard_dir, manifest in zip(shard_dirs, manifests)]
+    for _, row, relationships in heapq.merge(*streams, key=lambda item: item[0]):
+        if rows % chunk_size == 0:
+            if rows:
+                sink.close()
+            partition = f'file_{len(merged.partitions)}.{sink.extension}'
+            sink.open(f'{output_dir}/{partition}')
+            merged.partitions.append(partition)
+        sink.write(row, relationships)
+        rows += 1
+    if rows:
+        sink.close()
+
+    merged.finished = True
+    merged.save(output_dir)
+    logger.info(f'Merged {shard_count} shards into {output_dir}: {rows} rows, LLM usage cost: ${merged.llm_cost}')
+    return merged
@@ -0,0 +1,220 @@
+import json
+from abc import ABC, abstractmethod
+from collections import Counter
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pandas
+from rdflib import URIRef
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ModuleNotFoundError:
+    pyarrow = None
+
+
+class OutputSink(ABC):
+    """
+    An output sink writes the verbalized rows of a run into partition files. The processor opens a partition, writes
+    its rows one by one and closes it, before opening the next one.
+    """
+
+    # File extension of the partitions.
+    extension = ''
+
+    @abstractmethod
+    def open(self, path: str):
+        """
+        Start a new partition.
+        :param path: The path of the partition file.
+        """
+        pass
+
+    @abstractmethod
+    def write(self, row: dict, relationships: Counter):
+        """
+        Write a row to the current partition.
+        :param row: The row, without the relationship counts.
+        :param relationships: Number of occurrences of every relationship IRI in the fragment of the row.
+        """
+        pass
+
+    @abstractmethod
+    def close(self):
+        """
+        Finish the current partition.
+        """
+        pass
+
+    @classmethod
+    @abstractmethod
+    def read(cls, path: str) -> Iterator[tuple[dict, Counter]]:
+        """
+        Read back the rows of a partition written by this sink.
+        :param path: The path of the partition file.
+        :return: Generator of (row, relationships), in the same form they were written.
+        """
+        pass
+
+
+# the columns of a row, other than the relationship counts.
+ROW_COLUMNS = ('ontology', 'root', 'fragment', 'text', 'llm_text', 'model', 'statements', 'unique_concepts',
+               'unique_relationships', 'total_relationships')
+_INT_COLUMNS = {'statements', 'unique_concepts', 'unique_relationships', 'total_relationships'}
+
+
+def read_partition(path: str) -> Iterator[tuple[dict, Counter]]:
+    """
+    Read back the rows of a partition, with the sink that matches its file extension.
+    :param path: The path of the partition file.
+    :return: Generator of (row, relationships).
+    """
+    extension = Path(path).suffix.lstrip('.')
+    for sink in (CsvSink, JsonlSink, ParquetSink):
+        if sink.extension == extension:
+            return sink.read(path)
+    raise ValueError(f'Unknown partition format {extension}')
+
+
+class CsvSink(OutputSink):
+    """
+    Writes every partition as a CSV file, with a column per relationship IRI. The columns of each file depend on the
+    relationships of its rows.
+    """
+    extension = 'csv'
+
+    def __init__(self):
+        self._path: Optional[str] = None
+        self._rows = []
+
+    def open(self, path: str):
+        self._path = path
+        self._rows = []
+
+    def write(self, row: dict, relationships: Counter):
+        self._rows.append({**row, **relationships})
+
+    def close(self):
+        pandas.DataFrame(self._rows).to_csv(self._path, index=False)
+        self._rows = []
+
+    @classmethod
+    def read(cls, path: str) -> Iterator[tuple[dict, Counter]]:
+        # every value is read as written. Empty cells are the relationships that a row does not have, they also turn
+        # the counts of their column into floats.
+        frame = pandas.read_csv(path, dtype=str, keep_default_na=False)
+        for record in frame.to_dict('records'):
+            row = {column: record[column] for column in ROW_COLUMNS}
+            row['root'] = URIRef(row['root'])
+            row['llm_text'] = row['llm_text'] or None
+            for column in _INT_COLUMNS:
+                row[column] = int(row[column])
+            relationships = Counter({URIRef(column): int(float(value)) for column, value in record.items()
+                                     if column not in row and value != ''})
+            yield row, relationships
+
+
+class JsonlSink(OutputSink):
+    """
+    Appends every row to the partition as a JSON line, as soon as it is written. The relationship counts are stored in
+    a `relationships` object.
+    """
+    extension = 'jsonl'
+
+    def __init__(self):
+        self._file = None
+
+    def open(self, path: str):
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def write(self, row: dict, relationships: Counter):
+        record = {key: str(value) if key == 'root' else value for key, value in row.items()}
+        record['relationships'] = {str(iri): count for iri, count in relationships.items()}
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self._file.close()
+        self._file = None
+
+    @classmethod
+    def read(cls, path: str) -> Iterator[tuple[dict, Counter]]:
+        with open(path, encoding='utf-8') as file:
+            for line in file:
+                record = json.loads(line)
+                relationships = Counter({URIRef(iri): count for iri, count in record.pop('relationships').items()})
+                record['root'] = URIRef(record['root'])
+                yield record, relationships
+
+
+class ParquetSink(OutputSink):
+    """
+    Writes every partition as a Parquet file with a fixed schema, where the relationship counts are stored in a
+    `relationships` map column. Rows are written in row groups of `row_group_size` rows.
+    """
+    extension = 'parquet'
+
+    def __init__(self, row_group_size: int = 1000):
+        if not pyarrow:
+            raise ModuleNotFoundError("pyarrow is not installed. Please install it with `pip install pyarrow`")
+
+        self.row_group_size = row_group_size
+        self.schema = pyarrow.schema([
+            ('ontology', pyarrow.string()),
+            ('root', pyarrow.string()),
+            ('fragment', pyarrow.string()),
+            ('text', pyarrow.string()),
+            ('llm_text', pyarrow.string()),
+            ('model', pyarrow.string()),
+            ('statements', pyarrow.int64()),
+            ('unique_concepts', pyarrow.int64()),
+            ('unique_relationships', pyarrow.int64()),
+            ('total_relationships', pyarrow.int64()),
+            ('relationships', pyarrow.map_(pyarrow.string(), pyarrow.int64())),
+        ])
+        self._writer = None
+        self._columns = self._empty_columns()
+
+    def open(self, path: str):
+        self._writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self._columns = self._empty_columns()
+
+    def write(self, row: dict, relationships: Counter):
+        for name in self.schema.names:
+            if name == 'relationships':
+                value = [(str(iri), count) for iri, count in relationships.items()]
+            elif name == 'root':
+                value = str(row[name])
+            else:
+                value = row.get(name)
+            self._columns[name].append(value)
+
+        if len(self._columns['root']) >= self.row_group_size:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+        self._writer = None
+
+    @classmethod
+    def read(cls, path: str) -> Iterator[tuple[dict, Counter]]:
+        if not pyarrow:
+            raise ModuleNotFoundError("pyarrow is not installed. Please install it with `pip install pyarrow`")
+
+        for record in pyarrow.parquet.read_table(path).to_pylist():
+            relationships = Counter({URIRef(iri): count for iri, count in record.pop('relationships')})
+            record['root'] = URIRef(record['root'])
+            yield record, relationships
+
+    def _flush(self):
+        """
+        Write the buffered rows as a row group.
+        """
+        if not self._columns['root']:
+            return
+        self._writer.write_table(pyarrow.Table.from_pydict(self._columns, schema=self.schema))
+        self._columns = self._empty_columns()
+
+    def _empty_columns(self) -> dict[str, list]:
+        return {name: [] for name in self.schema.names}
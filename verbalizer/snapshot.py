@@ -0,0 +1,321 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import weakref
+from pathlib import Path
+from typing import Callable, Optional
+from xml.sax import SAXParseException
+
+import numpy
+from rdflib import Graph, URIRef, BNode, Literal
+from rdflib.plugins.stores.memory import Memory
+from rdflib.term import Node
+
+logger = logging.getLogger(__name__)
+
+# bumped whenever the layout of a snapshot changes, so stale snapshots are not loaded.
+SNAPSHOT_VERSION = 1
+
+# an XML document starts with a declaration, a comment, a doctype or a tag, which is followed by attributes, by the end
+# of the line or by another tag. Turtle and N3 documents can also start with '<', but with an IRI such as
+# <http://...> or <#a>, which is followed by the rest of a statement. An IRI alone on its line, such as <urn:x>, is
+# still taken for a tag, see `parse_file`.
+_XML_START = re.compile(r'<[?!]|<[A-Za-z_][\w.-]*(:[\w.-]+)?(\s|/?>\s*(<|$))')
+
+# bumped whenever the layout of a label snapshot changes, or the way the labels are harvested.
+LABEL_SNAPSHOT_VERSION = 2
+
+# the digest of the file every graph was loaded from by `load_graph`, and its number of triples then.
+_sources: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+# number of triples read from the memory-mapped array at a time.
+_LOAD_BLOCK = 1 << 16
+
+
+class _RecordingMemory(Memory):
+    """
+    In-memory store that records the triples in the order they were added. The order of the edges of a node depends on
+    it, so a graph rebuilt from the recorded triples is verbalized in exactly the same way.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.recorded: Optional[list[tuple[Node, Node, Node]]] = []
+
+    def add(self, triple, context, quoted=False):
+        if self.recorded is not None:
+            self.recorded.append(triple)
+        super().add(triple, context, quoted)
+
+
+def sniff_format(file_path: str) -> str:
+    """
+    Guess the format of an RDF file from its first bytes.
+    :param file_path: The path of the file.
+    :return: 'xml' for RDF/XML, 'n3' (a superset of Turtle) otherwise.
+    """
+    with open(file_path, 'rb') as file:
+        head = file.read(4096).decode('utf-8', errors='ignore').lstrip('\ufeff')
+
+    for line in head.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        return 'xml' if _XML_START.match(line) else 'n3'
+    return 'n3'
+
+
+def parse_file(file_path: str, store_factory: Callable[[], Memory] = Memory) -> Graph:
+    """
+    Parse an RDF file in the format sniffed from its content. If a file sniffed as RDF/XML turns out not to be XML, it
+    is parsed again as N3.
+    :param file_path: The path of the file.
+    :param store_factory: Creates the store of the graph.
+    :return: The graph.
+    """
+    file_format = sniff_format(file_path)
+    logger.info(f'Parsing {file_path} as {file_format}')
+    graph = Graph(store=store_factory())
+    try:
+        graph.parse(file_path, format=file_format)
+    except SAXParseException:
+        if file_format != 'xml':
+            raise
+        logger.info(f'{file_path} is not RDF/XML, parsing it as n3')
+        graph = Graph(store=store_factory())
+        graph.parse(file_path, format='n3')
+    return graph
+
+
+def file_digest(file_path: str) -> str:
+    """
+    Hash the content of a file, along with the snapshot version.
+    """
+    digest = hashlib.sha256(f'snapshot-v{SNAPSHOT_VERSION}'.encode())
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _blank_node_digests(graph: Graph) -> dict[BNode, str]:
+    """
+    Digest every blank node by what it describes: its predicates and objects, and the digests of the blank nodes among
+    them. Two parses of the same file give the blank nodes different ids, but the same digests. Where blank nodes form a
+    cycle, the node that closes it is digested as a placeholder.
+    """
+    digests = {}
+    in_progress = set()
+    for root in graph.subjects(unique=True):
+        if not isinstance(root, BNode) or root in digests:
+            continue
+        # depth-first, without recursion, as lists of thousands of cells are nested that deep.
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if node in digests:
+                continue
+            if not expanded:
+                in_progress.add(node)
+                stack.append((node, True))
+                stack.extend((obj, False) for obj in graph.objects(node)
+                             if isinstance(obj, BNode) and obj not in digests and obj not in in_progress)
+                continue
+            content = sorted(f'{predicate.n3()} {digests.get(obj, "_:cycle") if isinstance(obj, BNode) else obj.n3()}'
+                             for predicate, obj in graph.predicate_objects(node))
+            digests[node] = '_:' + hashlib.blake2b('\n'.join(content).encode('utf-8'), digest_size=16).hexdigest()
+            in_progress.discard(node)
+    return digests
+
+
+def graph_fingerprint(graph: Graph) -> str:
+    """
+    Hash the content of a graph, independently of the order of its triples and of the ids of its blank nodes. This
+    reads the whole graph, so when the graph was loaded from a file, the digest of the file is a cheaper fingerprint
+    (see `source_fingerprint`).
+    """
+    blank_nodes = _blank_node_digests(graph)
+    # a blank node that is only an object describes nothing.
+    empty = '_:' + hashlib.blake2b(b'', digest_size=16).hexdigest()
+    fingerprint = 0
+    for triple in graph:
+        text = ' '.join(blank_nodes.get(term, empty) if isinstance(term, BNode) else term.n3() for term in triple)
+        digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        fingerprint = (fingerprint + int.from_bytes(digest, 'big')) % (1 << 128)
+    return f'{fingerprint:032x}'
+
+
+def load_graph(file_path: str, cache_dir: Optional[str] = None) -> Graph:
+    """
+    Load a graph from a file. If a cache directory is set, the graph is loaded from the snapshot of the file when there
+    is one, and a snapshot is written after parsing otherwise.
+    :param file_path: The path of the file.
+    :param cache_dir: The directory of the snapshots.
+    :return: The graph.
+    """
+    digest = file_digest(file_path)
+    snapshot_dir = Path(cache_dir) / digest if cache_dir else None
+    if snapshot_dir and snapshot_dir.exists():
+        logger.info(f'Loading snapshot {snapshot_dir}')
+        graph = load_snapshot(str(snapshot_dir))
+    elif not snapshot_dir:
+        graph = parse_file(file_path)
+    else:
+        graph = parse_file(file_path, _RecordingMemory)
+        save_snapshot(graph, graph.store.recorded, str(snapshot_dir))
+        graph.store.recorded = None
+    record_source(graph, digest)
+    return graph
+
+
+def record_source(graph, digest: Optional[str]):
+    """
+    Record the digest of the file a graph (or a `GraphIndex` built from it) was loaded from, see `source_fingerprint`.
+    """
+    if digest is not None:
+        _sources[graph] = (digest, len(graph))
+
+
+def source_fingerprint(graph) -> Optional[str]:
+    """
+    :return: The `file_digest` of the file a graph was loaded from, or None if it was not loaded by `load_graph` or if
+    triples were added or removed since.
+    """
+    digest, size = _sources.get(graph, (None, None))
+    return digest if size == len(graph) else None
+
+
+def save_snapshot(graph: Graph, triples: list[tuple[Node, Node, Node]], directory: str):
+    """
+    Write a snapshot of a graph: a table of its interned terms and namespaces (`terms.json`) and an array with the ids
+    of the terms of every triple (`triples.npy`), in the order they were added to the graph.
+    The snapshot is written to a temporary directory first, so a snapshot is either complete or missing.
+    """
+    ids: dict[Node, int] = {}
+    terms = []
+    rows = numpy.empty((len(triples), 3), dtype=numpy.int32)
+    for i, triple in enumerate(triples):
+        for j, term in enumerate(triple):
+            term_id = ids.get(term)
+            if term_id is None:
+                term_id = ids[term] = len(terms)
+                terms.append(_encode_term(term))
+            rows[i, j] = term_id
+
+    Path(directory).parent.mkdir(parents=True, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=Path(directory).parent)
+    try:
+        with open(f'{temp_dir}/terms.json', 'w', encoding='utf-8') as file:
+            json.dump({
+                'namespaces': [[prefix, str(namespace)] for prefix, namespace in graph.namespaces()],
+                'terms': terms
+            }, file)
+        numpy.save(f'{temp_dir}/triples.npy', rows)
+        os.replace(temp_dir, directory)
+    except OSError:
+        # another process wrote the same snapshot in the meantime.
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        if not Path(directory).exists():
+            raise
+    logger.info(f'Saved snapshot {directory} with {len(rows)} triples and {len(terms)} terms')
+
+
+def load_snapshot(directory: str) -> Graph:
+    """
+    Rebuild a graph from a snapshot. The triple array is memory-mapped and streamed into the graph.
+    """
+    with open(f'{directory}/terms.json', encoding='utf-8') as file:
+        table = json.load(file)
+    terms = [_decode_term(term) for term in table['terms']]
+    rows = numpy.load(f'{directory}/triples.npy', mmap_mode='r')
+
+    graph = Graph()
+    for prefix, namespace in table['namespaces']:
+        graph.bind(prefix, namespace, override=True, replace=True)
+    for start in range(0, len(rows), _LOAD_BLOCK):
+        for subject, predicate, obj in rows[start:start + _LOAD_BLOCK].tolist():
+            graph.add((terms[subject], terms[predicate], terms[obj]))
+    return graph
+
+
+def save_label_snapshot(path: str, relationship_labels: dict[str, str], object_labels: dict[str, str],
+                        imports: Optional[dict[str, str]] = None):
+    """
+    Write the label maps of a vocabulary to an SQLite file. The rows keep the order of the maps.
+    The file is written under a temporary name first, so a snapshot is either complete or missing.
+    :param imports: IRI to fingerprint of the imports merged into the labels, see `label_snapshot_imports`.
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=Path(path).parent, suffix='.tmp')
+    os.close(handle)
+    try:
+        connection = sqlite3.connect(temp_path)
+        with connection:
+            connection.execute('CREATE TABLE labels (kind INTEGER NOT NULL, iri TEXT NOT NULL, label TEXT NOT NULL)')
+            connection.executemany('INSERT INTO labels VALUES (0, ?, ?)', relationship_labels.items())
+            connection.executemany('INSERT INTO labels VALUES (1, ?, ?)', object_labels.items())
+            connection.execute('CREATE TABLE imports (iri TEXT PRIMARY KEY, fingerprint TEXT NOT NULL)')
+            connection.executemany('INSERT INTO imports VALUES (?, ?)', (imports or {}).items())
+        connection.close()
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    logger.info(f'Saved label snapshot {path} with {len(relationship_labels)} relationships and '
+                f'{len(object_labels)} objects')
+
+
+def label_snapshot_imports(path: str) -> Optional[dict[str, str]]:
+    """
+    Read the imports recorded with the label maps of a vocabulary, without reading the labels.
+    :return: IRI to fingerprint of the imports, or None if there is no snapshot.
+    """
+    if not os.path.exists(path):
+        return None
+    connection = sqlite3.connect(path)
+    try:
+        return dict(connection.execute('SELECT iri, fingerprint FROM imports'))
+    finally:
+        connection.close()
+
+
+def load_label_snapshot(path: str) -> Optional[tuple[dict[str, str], dict[str, str]]]:
+    """
+    Read the label maps of a vocabulary from an SQLite file.
+    :return: (relationship labels, object labels) or None if there is no snapshot.
+    """
+    if not os.path.exists(path):
+        return None
+    maps = ({}, {})
+    connection = sqlite3.connect(path)
+    try:
+        for kind, iri, label in connection.execute('SELECT kind, iri, label FROM labels ORDER BY rowid'):
+            maps[kind][iri] = label
+    finally:
+        connection.close()
+    return maps
+
+
+def _encode_term(term: Node) -> list:
+    if isinstance(term, URIRef):
+        return ['u', str(term)]
+    if isinstance(term, BNode):
+        return ['b', str(term)]
+    if isinstance(term, Literal):
+        return ['l', str(term), term.datatype and str(term.datatype), term.language]
+    raise ValueError(f'Cannot store term {term!r} in a snapshot')
+
+
+def _decode_term(term: list) -> Node:
+    kind, value, *rest = term
+    if kind == 'u':
+        return URIRef(value)
+    if kind == 'b':
+        return BNode(value)
+    datatype, language = rest
+    return Literal(value, datatype=datatype, lang=language)
@@ -0,0 +1,297 @@
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+from rdflib import Graph, URIRef, BNode, Literal
+from rdflib.store import Store
+from rdflib.term import Node
+
+from verbalizer.snapshot import sniff_format
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    datatype TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    UNIQUE (kind, value, datatype, lang)
+);
+CREATE TABLE IF NOT EXISTS triples (
+    id INTEGER PRIMARY KEY,
+    s INTEGER NOT NULL,
+    p INTEGER NOT NULL,
+    o INTEGER NOT NULL,
+    UNIQUE (s, p, o)
+);
+CREATE INDEX IF NOT EXISTS triples_s ON triples (s, id);
+CREATE INDEX IF NOT EXISTS triples_p ON triples (p, o, id);
+CREATE INDEX IF NOT EXISTS triples_o ON triples (o, id);
+CREATE TABLE IF NOT EXISTS namespaces (
+    prefix TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL
+);
+"""
+
+# The in-memory store nests its indexes as spo, pos and osp, so the results of a pattern are grouped by the first
+# occurrence of the unbound positions of the index it reads, and follow the insertion order within a group. The order
+# of every pattern, by which positions are bound. All the triples are returned in insertion order, the in-memory store
+# returns them from a set.
+_ORDER_BY = {
+    (False, False, False): 'id',
+    (True, False, False): 'MIN(id) OVER (PARTITION BY p), id',
+    (True, True, False): 'id',
+    (True, False, True): '(SELECT MIN(id) FROM triples AS edges WHERE edges.s = triples.s AND edges.p = triples.p)',
+    (False, True, False): 'MIN(id) OVER (PARTITION BY o), id',
+    (False, True, True): 'id',
+    (False, False, True): 'MIN(id) OVER (PARTITION BY s), id',
+    (True, True, True): 'id',
+}
+
+
+class SQLiteStore(Store):
+    """
+    A disk-backed rdflib store that keeps the triples in an SQLite database, for ontologies that do not fit in memory.
+
+    Terms are interned into a `terms` table and the triples are stored as term ids, indexed by subject, by predicate
+    and object, and by object. Results come in the same order as from the in-memory rdflib store, so the verbalization
+    of a graph does not depend on where it is stored.
+
+    Use it through an rdflib graph, e.g. `Graph(store=SQLiteStore('ontology.db'))`, which works with the `Vocabulary`,
+    the `Verbalizer` and the `Processor` as any other graph. The store can be read from several threads, each of them
+    has its own connection.
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, path: str, term_cache_size: int = 100_000, batch_size: int = 50_000):
+        """
+        :param path: Path of the database file, it is created if it does not exist.
+        :param term_cache_size: Number of decoded terms kept in memory.
+        :param batch_size: Number of triples that are buffered before they are inserted.
+        """
+        super().__init__()
+        self.path = path
+        self.term_cache_size = term_cache_size
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending: list[tuple[int, int, int]] = []
+        self._ids: OrderedDict[tuple[str, str, str, str], int] = OrderedDict()
+        self._terms: OrderedDict[int, Node] = OrderedDict()
+        self.__prefix: dict[URIRef, str] = {}
+        self.__namespace: dict[str, URIRef] = {}
+        for prefix, namespace in self.connection.execute('SELECT prefix, namespace FROM namespaces'):
+            self.__namespace[prefix] = URIRef(namespace)
+            self.__prefix[URIRef(namespace)] = prefix
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        The connection to the database. Connections cannot be shared with other threads or forked processes, so
+        every thread of every process opens its own.
+        """
+        local = self._local
+        if getattr(local, 'connection', None) is None or local.pid != os.getpid():
+            local.connection = sqlite3.connect(self.path)
+            local.connection.executescript(_SCHEMA)
+            local.connection.execute('PRAGMA journal_mode=WAL')
+            local.connection.execute('PRAGMA synchronous=NORMAL')
+            local.pid = os.getpid()
+        return local.connection
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local'], state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def load(self, file_path: str, file_format: Optional[str] = None) -> int:
+        """
+        Bulk-load an ontology file into the store. The triples are streamed into the database in batches, in a single
+        transaction.
+        :param file_path: The path of the file.
+        :param file_format: The rdflib format of the file. default = detected from the file.
+        :return: The number of triples in the store.
+        """
+        file_format = file_format or sniff_format(file_path)
+        logger.info(f'Loading {file_path} as {file_format} into {self.path}')
+        with self.connection:
+            Graph(store=self).parse(file_path, format=file_format)
+            self._flush()
+        return len(self)
+
+    def add(self, triple, context=None, quoted=False):
+        self._pending.append(tuple(self._term_id(term, create=True) for term in triple))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def remove(self, triple_pattern, context=None):
+        self._flush()
+        where, params = self._where(triple_pattern)
+        if where is not None:
+            self.connection.execute(f'DELETE FROM triples WHERE {where}', params)
+
+    def triples(self, triple_pattern, context=None):
+        self._flush()
+        where, params = self._where(triple_pattern)
+        if where is None:
+            return
+
+        order = _ORDER_BY[tuple(term is not None for term in triple_pattern)]
+        cursor = self.connection.execute(f'SELECT s, p, o FROM triples WHERE {where} ORDER BY {order}', params)
+        for row in cursor:
+            yield tuple(self._term(term_id) for term_id in row), iter(())
+
+    def __len__(self, context=None) -> int:
+        self._flush()
+        return self.connection.execute('SELECT COUNT(*) FROM triples').fetchone()[0]
+
+    def contexts(self, triple=None):
+        return iter(())
+
+    def bind(self, prefix: str, namespace: URIRef, override: bool = True) -> None:
+        # should be identical to `Memory.bind`
+        bound_namespace = self.__namespace.get(prefix)
+        bound_prefix = self.__prefix.get(namespace)
+        if bound_prefix is None:
+            bound_prefix = self.__prefix.get(bound_namespace)
+        if override:
+            if bound_prefix is not None:
+                del self.__namespace[bound_prefix]
+            if bound_namespace is not None:
+                del self.__prefix[bound_namespace]
+            self.__prefix[namespace] = prefix
+            self.__namespace[prefix] = namespace
+        else:
+            self.__prefix[bound_namespace if bound_namespace is not None else namespace] = \
+                bound_prefix if bound_prefix is not None else prefix
+            self.__namespace[bound_prefix if bound_prefix is not None else prefix] = \
+                bound_namespace if bound_namespace is not None else namespace
+
+        with self.connection:
+            self.connection.execute('DELETE FROM namespaces')
+            self.connection.executemany('INSERT INTO namespaces VALUES (?, ?)',
+                                        [(prefix, str(namespace)) for prefix, namespace in self.__namespace.items()])
+
+    def namespace(self, prefix: str) -> Optional[URIRef]:
+        return self.__namespace.get(prefix)
+
+    def prefix(self, namespace: URIRef) -> Optional[str]:
+        return self.__prefix.get(namespace)
+
+    def namespaces(self) -> Iterator[tuple[str, URIRef]]:
+        yield from list(self.__namespace.items())
+
+    def commit(self):
+        self._flush()
+        self.connection.commit()
+
+    def close(self, commit_pending_transaction=False):
+        self.commit()
+        self.connection.close()
+        self._local.connection = None
+
+    def _flush(self):
+        """
+        Insert the buffered triples.
+        """
+        if self._pending:
+            self.connection.executemany('INSERT OR IGNORE INTO triples (s, p, o) VALUES (?, ?, ?)', self._pending)
+            self._pending = []
+
+    def _where(self, triple_pattern) -> tuple[Optional[str], list[int]]:
+        """
+        Build the filter of a triple pattern.
+        :return: The condition (None if a term of the pattern is not in the store) and its parameters.
+        """
+        conditions, params = [], []
+        for position, term in zip('spo', triple_pattern):
+            if term is None:
+                continue
+            term_id = self._term_id(term)
+            if term_id is None:
+                return None, []
+            conditions.append(f'{position} = ?')
+            params.append(term_id)
+
+        return ' AND '.join(conditions) or '1', params
+
+    def _term_id(self, term: Node, create: bool = False) -> Optional[int]:
+        """
+        Get the id of a term.
+        :param create: Whether to add the term to the store if it is not there yet.
+        :return: The id, or None if the term is not in the store.
+        """
+        key = _encode_term(term)
+        with self._lock:
+            term_id = self._ids.get(key)
+            if term_id is not None:
+                self._ids.move_to_end(key)
+                return term_id
+
+        row = self.connection.execute('SELECT id FROM terms WHERE kind = ? AND value = ? AND datatype = ? AND lang = ?',
+                                      key).fetchone()
+        if row:
+            term_id = row[0]
+        elif create:
+            term_id = self.connection.execute('INSERT INTO terms (kind, value, datatype, lang) VALUES (?, ?, ?, ?)',
+                                              key).lastrowid
+        else:
+            return None
+
+        with self._lock:
+            self._ids[key] = term_id
+            if len(self._ids) > self.term_cache_size:
+                self._ids.popitem(last=False)
+        return term_id
+
+    def _term(self, term_id: int) -> Node:
+        """
+        Get a term by its id.
+        """
+        with self._lock:
+            term = self._terms.get(term_id)
+            if term is not None:
+                self._terms.move_to_end(term_id)
+                return term
+
+        key = self.connection.execute('SELECT kind, value, datatype, lang FROM terms WHERE id = ?',
+                                      (term_id,)).fetchone()
+        term = _decode_term(key)
+        with self._lock:
+            self._terms[term_id] = term
+            if len(self._terms) > self.term_cache_size:
+                self._terms.popitem(last=False)
+        return term
+
+
+def _encode_term(term: Node) -> tuple[str, str, str, str]:
+    if isinstance(term, URIRef):
+        return 'u', str(term), '', ''
+    if isinstance(term, BNode):
+        return 'b', str(term), '', ''
+    if isinstance(term, Literal):
+        return 'l', str(term), str(term.datatype or ''), term.language or ''
+    raise ValueError(f'Cannot store term {term!r}')
+
+
+def _decode_term(key: tuple[str, str, str, str]) -> Node:
+    kind, value, datatype, lang = key
+    if kind == 'u':
+        return URIRef(value)
+    if kind == 'b':
+        return BNode(value)
+    return Literal(value, datatype=datatype or None, lang=lang or None)
@@ -0,0 +1,88 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from array import array
+from collections import defaultdict
+
+import numpy
+
+# the timer label lookups are charged to, see timed_label_lookups.
+label_timer: ContextVar = ContextVar('label_timer', default=None)
+
+
+class StageTimer:
+    """
+    Measures the time spent in the stages of a verbalization. Stages can be nested, in which case the time of the nested
+    stage only counts towards the nested stage, so the stages add up to the total time.
+    """
+
+    def __init__(self):
+        self.totals: dict[str, float] = defaultdict(float)
+        self._stack: list[str] = []
+        self._started = 0.0
+
+    def start(self, stage: str):
+        now = time.perf_counter()
+        if self._stack:
+            self.totals[self._stack[-1]] += now - self._started
+        self._stack.append(stage)
+        self._started = now
+
+    def stop(self):
+        now = time.perf_counter()
+        self.totals[self._stack.pop()] += now - self._started
+        self._started = now
+
+
+@contextmanager
+def timed_label_lookups(timer: StageTimer):
+    """
+    Charge the label lookups of every vocabulary to the `label_lookup` stage of a timer, wherever they are made from
+    (expansion, patterns or the fragment), for the duration of the block. The timer is per context, so concurrent
+    verbalizations sharing a vocabulary time their own lookups.
+    """
+    token = label_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        label_timer.reset(token)
+
+
+class TimingSummary:
+    """
+    Collects the stage timings and query counts of the verbalized concepts of a run, and summarizes them.
+    """
+
+    def __init__(self):
+        self._samples: dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._samples.get('total', ()))
+
+    def add(self, timings: dict[str, float], graph_accesses: int):
+        """
+        Add the timings of a concept.
+        :param timings: Seconds spent per stage.
+        :param graph_accesses: Number of graph queries made for the concept.
+        """
+        for stage, seconds in timings.items():
+            self._samples.setdefault(stage, array('d')).append(seconds)
+        self._samples.setdefault('graph_accesses', array('d')).append(graph_accesses)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """
+        :return: For every stage (in seconds) and for the query counts: the count, total, mean, p50, p95 and p99.
+        """
+        summary = {}
+        for stage, samples in self._samples.items():
+            values = numpy.frombuffer(samples, dtype=numpy.float64)
+            p50, p95, p99 = numpy.percentile(values, [50, 95, 99])
+            summary[stage] = {
+                'count': len(values),
+                'total': float(values.sum()),
+                'mean': float(values.mean()),
+                'p50': float(p50),
+                'p95': float(p95),
+                'p99': float(p99),
+            }
+        return summary
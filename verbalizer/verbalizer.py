@@ -1,21 +1,30 @@
+import contextlib
 import dataclasses
+import hashlib
 import re
+import time
 import typing
-from collections import Counter
+from collections import Counter, OrderedDict
 from dataclasses import dataclass
 from typing import Type
 
 from rdflib import Graph
 from rdflib import RDFS, RDF, OWL
 from rdflib import URIRef, Literal, BNode
+from rdflib.plugins.sparql import prepareQuery
 from rdflib.term import Node
 
 from verbalizer.nlp import ParaphraseLanguageModel
 from verbalizer.patterns import Pattern
+from verbalizer.timings import StageTimer, timed_label_lookups
 from verbalizer.vocabulary import Vocabulary
 
 _RE_COMBINE_WHITESPACE = re.compile(r"\s+")
 
+# Query used to fetch the outgoing relationships of a single node. The subject is bound when the query is executed,
+# which lets the store resolve it by key instead of walking the path from the root.
+_NEXT_STEP_QUERY = prepareQuery('SELECT ?p ?o WHERE { ?s ?p ?o }')
+
 default_patterns = []
 
 
@@ -75,13 +84,47 @@ class VerbalizationEdge:
         return f'{display}{next_text}'
 
 
+class VerbalizationPath:
+    """
+    The path from the root of a verbalization tree to a node, stored as a link to the path it extends. The nodes of a
+    tree share the prefix of their paths instead of copying it, so extending a path costs the same at any depth.
+    """
+    __slots__ = ('parent', 'step')
+
+    def __init__(self, parent: typing.Optional['VerbalizationPath'], step: tuple[Node, typing.Optional[Node]]):
+        self.parent = parent
+        self.step = step
+
+    @classmethod
+    def from_list(cls, steps: list[tuple[Node, typing.Optional[Node]]]) -> typing.Optional['VerbalizationPath']:
+        path = None
+        for step in steps:
+            path = cls(path, step)
+        return path
+
+    def to_list(self) -> list[tuple[Node, typing.Optional[Node]]]:
+        steps = []
+        path = self
+        while path is not None:
+            steps.append(path.step)
+            path = path.parent
+        steps.reverse()
+        return steps
+
+
 class VerbalizationNode:
-    def __init__(self, concept, parent_path=None):
+    def __init__(self, concept, parent_path=None, context: 'VerbalizationContext' = None):
+        """
+        :param concept: The concept of the node.
+        :param parent_path: The path to the parent of the node, as a `VerbalizationPath` or a list of tuple
+        (concept, relationship).
+        :param context: The state of the verbalization the node is part of, if any.
+        """
         self.concept = concept
-        if parent_path is None:
-            self._true_path = [(concept, None)]
-        else:
-            self._true_path = parent_path + [(concept, None)]
+        self.context = context
+        if isinstance(parent_path, list):
+            parent_path = VerbalizationPath.from_list(parent_path)
+        self._parent_path: typing.Optional[VerbalizationPath] = parent_path
         self.references: list[VerbalizationEdge] = []
         self._display = None
 
@@ -97,14 +140,39 @@ class VerbalizationNode:
         Get the full path including the current node.
         :return: List of tuple (URIRef, URIRef)
         """
-        return list(self._true_path)
+        return self.path_to(None).to_list()
 
     def get_parent_path(self):
         """
         Get the full path excluding the current node.
         :return: List of tuple (URIRef, URIRef)
         """
-        return list(self._true_path[:-1])
+        return self._parent_path.to_list() if self._parent_path else []
+
+    @property
+    def parent_path(self) -> typing.Optional[VerbalizationPath]:
+        """
+        Get the path to the parent of the node, without copying it.
+        """
+        return self._parent_path
+
+    def path_to(self, relationship) -> VerbalizationPath:
+        """
+        Get the path to a node reached from this node through a relationship, i.e. the parent path of that node.
+        :param relationship: The relationship, or None for the path to this node.
+        :return: The path, which shares the path of this node.
+        """
+        return VerbalizationPath(self._parent_path, (self.concept, relationship))
+
+    def child(self, concept, relationship) -> 'VerbalizationNode':
+        """
+        Create a node reached from this node through a relationship. It is part of the same verbalization, so it is
+        expanded with the same prefetched description, subtree hashes, stats and timer.
+        :param concept: The concept of the new node.
+        :param relationship: The relationship from this node to the new node.
+        :return: The new node, which is not added as an edge of this node.
+        """
+        return VerbalizationNode(concept, parent_path=self.path_to(relationship), context=self.context)
 
     def get_next_node(self, relationship, concept):
         for reference in self.references:
@@ -164,6 +232,20 @@ class VerbalizationNode:
         return f'{indefinite_article}{display}{next_text}'
 
 
+class _VerbalizedNode(VerbalizationNode):
+    """
+    A node of a subtree taken from the subtree cache. Its text was verbalized when the subtree was cached, so it does
+    not hold the nodes of the verbalization that built it.
+    """
+
+    def __init__(self, concept, parent_path, context: 'VerbalizationContext', text: str):
+        super().__init__(concept, parent_path=parent_path, context=context)
+        self._text = text
+
+    def verbalize(self) -> str:
+        return self._text
+
+
 @dataclass
 class VerbalizerModelUsageConfig:
     """
@@ -183,29 +265,110 @@ class VerbalizerInstanceStats:
     statements = 0
     relationship_counter: Counter = dataclasses.field(default_factory=Counter)
     concepts: set = dataclasses.field(default_factory=set)
+    graph_accesses: int = 0
+    prefetched_lookups: int = 0
+    subtree_cache_hits: int = 0
+    subtree_cache_misses: int = 0
+    label_cache_hits: int = 0
+    label_cache_misses: int = 0
+    # seconds spent per stage, only collected if the verbalizer measures timings.
+    timings: dict[str, float] = dataclasses.field(default_factory=dict)
+
+    @property
+    def graph_accesses_saved(self) -> int:
+        """
+        Number of graph accesses saved by prefetching, i.e. the lookups that were served from the prefetched
+        description minus the accesses made to prefetch it. Prefetching reads every node of the description once, so
+        this is 0 when the expansion needed all of them, and negative when it did not.
+        """
+        if not self.prefetched_lookups:
+            return 0
+        return self.prefetched_lookups - self.graph_accesses
+
+
+@dataclass
+class VerbalizationContext:
+    """
+    The state of a single call to `Verbalizer.verbalize`. It is carried by the nodes of the tree being built, so that
+    concurrent and nested verbalizations with the same verbalizer do not share it.
+    """
+    stats: VerbalizerInstanceStats
+    timer: typing.Optional[StageTimer] = None
+    # the concise bounded description of the concept, if it was prefetched.
+    prefetched: typing.Optional[dict[Node, list[tuple[Node, Node]]]] = None
+    # the relationships of the blank nodes fetched to compute their structural hash, see `_structural_key`.
+    structural: dict[BNode, list[tuple[Node, Node]]] = dataclasses.field(default_factory=dict)
+    subtree_keys: dict[BNode, typing.Optional[tuple[bytes, list[BNode]]]] = dataclasses.field(default_factory=dict)
 
 
 class Verbalizer:
     prefix = 'https://zaitoun.dev/onto/'
 
+    # Supported expansion engines. `sparql` resolves the neighbours of a node with a SPARQL query, `native` reads them
+    # straight from the graph and `index` reads them from the compact index of the vocabulary (see `GraphIndex`).
+    # All of them look the node up by its identity, so the cost does not depend on its depth.
+    engines = ('sparql', 'native', 'index')
+
+    # The stages measured when timings are enabled. `expand` is the time spent building the tree that is not spent in
+    # one of the other stages.
+    stages = ('graph_query', 'pattern', 'label_lookup', 'expand', 'verbalize_tree', 'fragment', 'llm')
+
     def __init__(
             self,
             vocabulary: Vocabulary,
             patterns: list[Type[Pattern]] = None,
             language_model: ParaphraseLanguageModel = None,
-            usage_config: VerbalizerModelUsageConfig = None
+            usage_config: VerbalizerModelUsageConfig = None,
+            engine: str = 'sparql',
+            subtree_cache_size: int = 0,
+            timings: bool = False
     ):
-        self.graph = vocabulary.graph
+        """
+        :param vocabulary: The vocabulary to use.
+        :param patterns: The patterns to apply.
+        :param language_model: Language model used to paraphrase the CNL text.
+        :param usage_config: Configures when the language model is used.
+        :param engine: The expansion engine, one of `engines`.
+        :param subtree_cache_size: Maximum number of verbalized blank node subtrees to keep in memory, so that
+        structurally identical anonymous class expressions are only verbalized once. 0 disables the cache.
+        :param timings: If True, the time spent in every stage of a verbalization (see `stages`) is reported in the
+        returned stats.
+        """
+        if engine not in self.engines:
+            raise VerbalizationInitError(f'Unknown engine {engine}. Expected one of {", ".join(self.engines)}.')
+        if engine == 'sparql' and not isinstance(vocabulary.graph, Graph):
+            raise VerbalizationInitError('The sparql engine requires a vocabulary over an rdflib graph, use the native '
+                                         'or index engine with a vocabulary over a GraphIndex.')
+
+        self.engine = engine
+        self.graph = vocabulary.index if engine == 'index' else vocabulary.graph
         self.vocab = vocabulary
         self.llm = language_model
         self.llm_config = usage_config or VerbalizerModelUsageConfig(0, 2, "")
         self.patterns = [pattern(self.graph, self, vocabulary) for pattern in patterns or default_patterns]
         self._check_conflicts()
 
-    def verbalize(self, starting_concept: typing.Union[str, URIRef]) -> (str, str, str, VerbalizerInstanceStats):
+        # Dispatch table of the patterns, see `_select_patterns`.
+        self._dispatch: dict[frozenset[Node], tuple[Pattern, ...]] = {}
+        self._all_triggers = None
+        if all(pattern.trigger_relations is not None for pattern in self.patterns):
+            self._all_triggers = frozenset().union(*(pattern.trigger_relations for pattern in self.patterns))
+
+        self.timings = timings
+
+        # LRU cache of structural hash to verbalized blank node subtree, see `_verbalize_blank_node`.
+        self.subtree_cache_size = subtree_cache_size
+        self._subtree_cache: OrderedDict[bytes, tuple[list[tuple], list[tuple], int]] = OrderedDict()
+
+    def verbalize(self,
+                  starting_concept: typing.Union[str, URIRef],
+                  prefetch: bool = False) -> (str, str, str, VerbalizerInstanceStats):
         """
         Returns the Turtle fragment, CNL statement, LLM verbalized textual description, and stats.
         :param starting_concept: The URI of the concept to verbalize.
+        :param prefetch: If True, the concise bounded description of the concept (all the triples reachable through
+        blank nodes) is read up front, and the tree and patterns are evaluated against it in memory. It does not save
+        store calls, but with the sparql engine the nodes are read directly instead of with a query each.
         :return: (fragment, CNL text, LLM text, stats)
         """
         sentences = set()
@@ -215,14 +378,34 @@ class Verbalizer:
         if isinstance(starting_concept, str):
             starting_concept = URIRef(starting_concept)
 
-        node = VerbalizationNode(starting_concept)
-        self._verbalize_as_text_from(node, self.vocab, triples, stats)
-
-        for ref in node.references:
-            sentences.add(_RE_COMBINE_WHITESPACE.sub(" ", f'{node.display} {ref.verbalize().strip()}.').strip())
-
-        text = '\n'.join(sorted(sentences))
-        onto_fragment: str = self.generate_fragment(triples)
+        label_cache_hits, label_cache_misses = self.vocab.label_cache_hits, self.vocab.label_cache_misses
+        timer = StageTimer() if self.timings else None
+        started = time.perf_counter()
+        context = VerbalizationContext(stats, timer)
+        node = VerbalizationNode(starting_concept, context=context)
+
+        # label lookups are timed wherever they are made, including in patterns and the fragment.
+        with timed_label_lookups(timer) if timer else contextlib.nullcontext():
+            if timer:
+                timer.start('expand')
+            if prefetch:
+                context.prefetched = self.concise_bounded_description(starting_concept, context)
+            self._verbalize_as_text_from(node, self.vocab, triples, stats)
+            if timer:
+                timer.stop()
+
+            if timer:
+                timer.start('verbalize_tree')
+            for ref in node.references:
+                sentences.add(_RE_COMBINE_WHITESPACE.sub(" ", f'{node.display} {ref.verbalize().strip()}.').strip())
+
+            text = '\n'.join(sorted(sentences))
+            if timer:
+                timer.stop()
+                timer.start('fragment')
+            onto_fragment: str = self.generate_fragment(triples)
+            if timer:
+                timer.stop()
 
         # update stats
         for triple in triples:
@@ -236,12 +419,22 @@ class Verbalizer:
                 stats.concepts.add(obj)
 
         stats.statements = len(sentences)
+        stats.label_cache_hits = self.vocab.label_cache_hits - label_cache_hits
+        stats.label_cache_misses = self.vocab.label_cache_misses - label_cache_misses
 
         # convert the pseudo text into proper English.
         use_llm = bool(self.llm and self._check_llm_usage_policy(stats))
         llm_text = None
         if use_llm:
+            if timer:
+                timer.start('llm')
             llm_text = self.llm.pseudo_to_text(text, extra=self.llm_config.extra_context)
+            if timer:
+                timer.stop()
+
+        if timer:
+            stats.timings = {stage: timer.totals.get(stage, 0.0) for stage in self.stages}
+            stats.timings['total'] = time.perf_counter() - started
 
         return onto_fragment, text, llm_text, stats
 
@@ -262,23 +455,34 @@ class Verbalizer:
         :param stats: used to collect statistics
         :return: None
         """
-        query = self.next_step_query_builder(node)
-        results = self.graph.query(query)
+        results = self.next_step(node)
 
         results_normalized = False
+        # the nodes built by the pattern, by (relationship, concept), so a long list is not searched once per item.
+        built = None
         required_iris = set()
 
+        timer = node.context.timer if node.context else None
+        if timer:
+            timer.start('pattern')
+
         # check patterns
-        for pattern in self.patterns:
-            if not pattern.check(results):
+        for pattern in self._select_patterns(results):
+            if pattern.trigger_relations is None and not pattern.check(results):
                 continue
 
-            results = pattern.normalize(node, triple_collector)
+            if pattern.receives_results:
+                results = pattern.normalize(node, triple_collector, results)
+            else:
+                results = pattern.normalize(node, triple_collector)
             required_iris = pattern.guarded_iris()
             results_normalized = True
             stats.patterns_evaluated += 1
             break
 
+        if timer:
+            timer.stop()
+
         # set node display
         node.display = vocab.get_class_label(node.concept)
 
@@ -297,7 +501,7 @@ class Verbalizer:
 
             if not results_normalized:
                 # Continue to expand the graph
-                next_node = VerbalizationNode(obj_2, parent_path=node.get_parent_path() + [(node.concept, relation)])
+                next_node = node.child(obj_2, relation)
                 edge = VerbalizationEdge(relation, next_node)
                 node.add_edge(edge)
                 edge.display = relation_display
@@ -306,20 +510,218 @@ class Verbalizer:
                 triple_collector.append((node.concept, relation, next_node.concept))
             else:
                 # we already built this part of the graph so we just need to fetch it out.
-                next_node = node.get_next_node(relation, obj_2)
+                if built is None:
+                    built = {}
+                    for reference in node.references:
+                        built.setdefault((reference.relationship, reference.node.concept), reference.node)
+                next_node = built.get((relation, obj_2))
 
             if isinstance(obj_2, URIRef):
                 obj_display_2 = vocab.get_class_label(obj_2)
             elif isinstance(obj_2, Literal):
                 obj_display_2 = obj_2.toPython()
             elif isinstance(obj_2, BNode):
-                self._verbalize_as_text_from(next_node, vocab, triple_collector, stats)
+                self._verbalize_blank_node(next_node, vocab, triple_collector, stats)
                 continue
             else:
                 obj_display_2 = None
 
             next_node.display = obj_display_2
 
+    def _verbalize_blank_node(self,
+                              node: VerbalizationNode,
+                              vocab: Vocabulary,
+                              triple_collector: list[tuple[Node, Node, Node]],
+                              stats: VerbalizerInstanceStats):
+        """
+        Expand a blank node. If the subtree cache is enabled, a subtree that is structurally identical to one that was
+        already expanded is taken from the cache: its edges are rebuilt for the current node from their relationship,
+        concept, display and text, and its triples are mapped onto the blank nodes of the current subtree.
+        """
+        key = self._structural_key(node.concept, node.context) if self.subtree_cache_size > 0 and node.context else None
+        if key is None:
+            self._verbalize_as_text_from(node, vocab, triple_collector, stats)
+            return
+
+        digest, blank_nodes = key
+        if cached := self._subtree_cache.get(digest):
+            self._subtree_cache.move_to_end(digest)
+            edges, triples, patterns_evaluated = cached
+            node.display = vocab.get_class_label(node.concept)
+            node.references = []
+            for relationship, concept, display, text in edges:
+                concept = blank_nodes[concept] if isinstance(concept, int) else concept
+                edge = VerbalizationEdge(relationship, _VerbalizedNode(concept, node.path_to(relationship),
+                                                                       node.context, text))
+                edge.display = display
+                node.add_edge(edge)
+            triple_collector.extend(
+                tuple(blank_nodes[term] if isinstance(term, int) else term for term in triple) for triple in triples
+            )
+            stats.patterns_evaluated += patterns_evaluated
+            stats.subtree_cache_hits += 1
+            return
+
+        stats.subtree_cache_misses += 1
+        start, patterns_evaluated = len(triple_collector), stats.patterns_evaluated
+        self._verbalize_as_text_from(node, vocab, triple_collector, stats)
+
+        # store the triples and edges with the blank nodes replaced by their position in the subtree.
+        positions = {blank_node: i for i, blank_node in enumerate(blank_nodes)}
+        triples = []
+        for triple in triple_collector[start:]:
+            if any(isinstance(term, BNode) and term not in positions for term in triple):
+                return
+            triples.append(tuple(positions[term] if isinstance(term, BNode) else term for term in triple))
+
+        edges = []
+        for edge in node.references:
+            concept = edge.node.concept
+            if isinstance(concept, BNode):
+                if concept not in positions:
+                    return
+                concept = positions[concept]
+            edges.append((edge.relationship, concept, edge.display, edge.node.verbalize()))
+
+        self._subtree_cache[digest] = (edges, triples, stats.patterns_evaluated - patterns_evaluated)
+        if len(self._subtree_cache) > self.subtree_cache_size:
+            self._subtree_cache.popitem(last=False)
+
+    def _structural_key(self, blank_node: BNode,
+                        context: VerbalizationContext) -> typing.Optional[tuple[bytes, list[BNode]]]:
+        """
+        Compute the structural hash of the subtree of a blank node. Two subtrees have the same hash if they have the same
+        relationships, in the same order, to the same named concepts and literals, and to blank nodes that have the same
+        hash in turn. The relationships fetched along the way are kept, so the expansion does not fetch them again.
+        :param blank_node: The root of the subtree.
+        :param context: The verbalization in progress.
+        :return: The hash and the blank nodes of the subtree in traversal order, or None if the subtree shares or
+        cycles through blank nodes, in which case it cannot be cached.
+        """
+        if blank_node in context.subtree_keys:
+            return context.subtree_keys[blank_node]
+
+        # guards against cycles.
+        context.subtree_keys[blank_node] = None
+
+        if blank_node not in context.structural:
+            context.structural[blank_node] = self.next_step(VerbalizationNode(blank_node, context=context))
+
+        digest = hashlib.blake2b(digest_size=16)
+        blank_nodes = [blank_node]
+        for relation, obj in context.structural[blank_node]:
+            digest.update(relation.n3().encode() + b'\x1f')
+            if isinstance(obj, BNode):
+                child = self._structural_key(obj, context)
+                if child is None:
+                    return None
+                child_digest, child_blank_nodes = child
+                digest.update(b'[' + child_digest + b']\x1e')
+                blank_nodes.extend(child_blank_nodes)
+            else:
+                digest.update(obj.n3().encode() + b'\x1e')
+
+        if len(set(blank_nodes)) != len(blank_nodes):
+            return None
+
+        key = context.subtree_keys[blank_node] = (digest.digest(), blank_nodes)
+        return key
+
+    def clear_subtree_cache(self):
+        """
+        Remove all the verbalized subtrees from the cache. Should be called if the vocabulary has changed.
+        """
+        self._subtree_cache.clear()
+
+    def _select_patterns(self, results: list[tuple[Node, Node]]) -> tuple[Pattern, ...]:
+        """
+        Get the patterns that may apply to a node, in order. Patterns that declare triggers are resolved from the set of
+        relations of the node, which is cached, so they are already known to match. Patterns that do not declare them
+        are always returned and still need to be checked.
+        :param results: The outgoing relationships of the node.
+        :return: Tuple of patterns.
+        """
+        relations = frozenset(relation for (relation, obj) in results)
+
+        # nothing can match, skip the lookup entirely.
+        if self._all_triggers is not None and self._all_triggers.isdisjoint(relations):
+            return ()
+
+        candidates = self._dispatch.get(relations)
+        if candidates is None:
+            candidates = self._dispatch[relations] = tuple(
+                pattern for pattern in self.patterns
+                if pattern.trigger_relations is None or pattern.matches(relations)
+            )
+        return candidates
+
+    def next_step(self, node: VerbalizationNode) -> list[tuple[Node, Node]]:
+        """
+        Get all the outgoing relationships of the node, using the configured engine. If the node is part of a
+        verbalization, they are served from its prefetched description when possible, and counted in its stats.
+        :param node: The node to expand.
+        :return: List of tuple (relationship, object)
+        """
+        context = node.context
+        if context is None:
+            return self._fetch(node.concept)
+
+        if context.prefetched is not None and node.concept in context.prefetched:
+            context.stats.prefetched_lookups += 1
+            return list(context.prefetched[node.concept])
+
+        # fetched already to hash the subtree of the node, and counted then.
+        if node.concept in context.structural:
+            return list(context.structural[node.concept])
+
+        context.stats.graph_accesses += 1
+        if context.timer:
+            context.timer.start('graph_query')
+        try:
+            return self._fetch(node.concept)
+        finally:
+            if context.timer:
+                context.timer.stop()
+
+    def _fetch(self, concept: Node) -> list[tuple[Node, Node]]:
+        """
+        Query the outgoing relationships of a concept with the configured engine.
+        """
+        if self.engine in ('native', 'index'):
+            return list(self.graph.predicate_objects(concept))
+
+        return list(self.graph.query(_NEXT_STEP_QUERY, initBindings={'s': concept}))
+
+    def concise_bounded_description(self, concept: Node,
+                                    context: VerbalizationContext = None) -> dict[Node, list[tuple[Node, Node]]]:
+        """
+        Collect the concise bounded description of a concept: its outgoing relationships, and recursively the ones of
+        every blank node reachable from it. The relationships of every node are read from the adjacency of the graph
+        (or of the index), one store call per node, the same number of calls the expansion would make. With the sparql
+        engine, this replaces a query per node with a direct read.
+        :param concept: The concept.
+        :param context: The verbalization the description is collected for, if any.
+        :return: Dictionary of subject to list of tuple (relationship, object)
+        """
+        if context and context.timer:
+            context.timer.start('graph_query')
+
+        description = {}
+        pending = [concept]
+        while pending:
+            subject = pending.pop()
+            if subject in description:
+                continue
+
+            description[subject] = list(self.graph.predicate_objects(subject))
+            if context:
+                context.stats.graph_accesses += 1
+            pending.extend(obj for _, obj in description[subject] if isinstance(obj, BNode))
+
+        if context and context.timer:
+            context.timer.stop()
+        return description
+
     @classmethod
     def next_step_query_builder(cls, node: VerbalizationNode) -> str:
         """
@@ -337,6 +739,9 @@ class Verbalizer:
         Then the output is query that would return:
         B -[rel]-> C
         B -[rel]-> D
+
+        Note that the cost of the query grows with the depth of the node. `next_step` resolves the node directly and
+        should be preferred.
         """
 
         trail = node.get_path()
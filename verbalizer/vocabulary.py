@@ -1,10 +1,56 @@
-import re
+import hashlib
+import itertools
 import logging
-from rdflib import URIRef, Graph
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional
+
+from rdflib import URIRef, BNode, Graph, RDF, RDFS, OWL
 from tqdm import tqdm
 
+from verbalizer.imports import ImportResolver
+from verbalizer.index import GraphIndex
+from verbalizer.snapshot import LABEL_SNAPSHOT_VERSION, label_snapshot_imports, load_label_snapshot, \
+    save_label_snapshot, source_fingerprint
+from verbalizer.timings import label_timer
+
 logger = logging.getLogger(__name__)
 
+_NON_ALPHANUMERIC = re.compile('[^0-9a-zA-Z]+')
+_CAMEL_WORD = re.compile('(.)([A-Z][a-z]+)')
+_CAMEL_BOUNDARY = re.compile('([a-z0-9])([A-Z])')
+
+
+class _LazyLabels(dict):
+    """
+    Label map that resolves the label of a URI the first time it is looked up, and memoizes it.
+    """
+
+    def __init__(self, resolve: Callable[[str], Optional[str]]):
+        super().__init__()
+        self._resolve = resolve
+        self._unlabeled = set()
+
+    def __missing__(self, key):
+        if key in self._unlabeled:
+            raise KeyError(key)
+        label = self._resolve(key)
+        if label is None:
+            self._unlabeled.add(key)
+            raise KeyError(key)
+        self[key] = label
+        return label
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
 
 class Vocabulary:
     """
@@ -13,6 +59,8 @@ class Vocabulary:
 
     IGNORE_VALUE = object()
 
+    # the queries the label maps were built with. They are no longer used, the maps are built in a single pass over the
+    # graph with the same results, but are kept as the reference of what the maps hold.
     RELATIONSHIP_QUERY = """
     SELECT DISTINCT ?p ?relation
     WHERE {
@@ -56,26 +104,187 @@ class Vocabulary:
     }
     """
 
-    def __init__(self, graph: Graph, ignore: set[str] = None, guard: set[str] = None, rephrased: dict[str, str] = None):
+    def __init__(self, graph: Graph | GraphIndex, ignore: set[str] = None, guard: set[str] = None,
+                 rephrased: dict[str, str] = None,
+                 cache_dir: Optional[str] = None, fingerprint: Optional[str] = None, lazy: bool = False,
+                 label_cache_size: int = 100_000, import_resolver: Optional[ImportResolver] = None,
+                 load_imports: bool = True):
         """
-        :param graph: The ontology.
+        :param graph: The ontology, or its `GraphIndex`. A vocabulary over an index does not hold the rdflib graph, which
+        can then be released; it can only be verbalized with the `native` or `index` engine.
         :param ignore: URIs to ignore.
         :param guard: URIs to keep in the fragment even if they are in the ignore list.
         :param rephrased: URIs to rephrase/rename
+        :param cache_dir: If set, the label maps (including the labels of the imports) are loaded from a snapshot in
+        this directory when there is one, and a snapshot is written after building them otherwise.
+        :param fingerprint: Identifies the content of the graph in the snapshot key, e.g. its `graph_fingerprint`.
+        default = the `file_digest` of the file the graph was loaded from by `Processor.from_file`. It is required with
+        `cache_dir` for any other graph.
+        :param lazy: If True, the label of a URI is resolved from the graph the first time it is looked up, instead of
+        labeling every URI of the ontology up front, so a sampled run only pays for the concepts it touches. The labels
+        are the same. A lazy vocabulary does not write a snapshot.
+        :param label_cache_size: Maximum number of looked up labels to memoize, per label map. The memo is cleared when
+        a label map, `rephrased` or `ignore` is set, other changes to the vocabulary require `clear_label_cache`. 0
+        disables it.
+        :param import_resolver: Where the owl:imports of the ontology are loaded from. default = their IRI
+        :param load_imports: If False, the labels of the owl:imports of the ontology are not loaded.
         """
         logger.info('Initializing vocabulary')
         self.graph = graph
-        self.relationship_labels = self._get_ontology_relationship_labels()
-        self.object_labels = self._get_ontology_object_labels()
-        self._load_imports()
+        self._index = graph if isinstance(graph, GraphIndex) else None
+        self._lazy = lazy
+        self.import_resolver = import_resolver
+        self._load_imports_enabled = load_imports
+        self._imports: list[Vocabulary] = []
+        self._import_closure: Optional[dict[str, tuple[Graph, list[str]]]] = None
+        self._last_labels: Optional[dict] = None
+        # LRU memo of `_util_lookup`, per label map ('relationship' or 'object').
+        self.label_cache_size = label_cache_size
+        self._label_cache: dict[str, OrderedDict] = {}
+        self.label_cache_hits = 0
+        self.label_cache_misses = 0
+        snapshot_path = self._label_snapshot_path(cache_dir, fingerprint) if cache_dir else None
+        labels = self._load_label_snapshot(snapshot_path) if snapshot_path else None
+        if labels:
+            logger.info(f'Loaded labels from {snapshot_path}')
+            self.relationship_labels, self.object_labels = labels
+        elif lazy:
+            self.relationship_labels = _LazyLabels(self._resolve_relationship_label)
+            self.object_labels = _LazyLabels(self._resolve_object_label)
+            self._load_imports()
+        else:
+            self.relationship_labels = self._get_ontology_relationship_labels()
+            self.object_labels = self._get_ontology_object_labels()
+            self._load_imports()
+            if snapshot_path:
+                save_label_snapshot(snapshot_path, self.relationship_labels, self.object_labels,
+                                    self._import_fingerprints())
         self.rephrased = rephrased or dict()
-        self._ignore_list = ignore or {}
+        self.ignore = ignore or {}
         self._guard_list = guard or {
             'http://www.w3.org/1999/02/22-rdf-syntax-ns#type',
             'http://www.w3.org/2000/01/rdf-schema#label',
             'http://www.w3.org/2002/07/owl#onDatatype'
         }
 
+    @property
+    def relationship_labels(self) -> dict[str, str]:
+        """
+        URI to label of the relationships.
+        """
+        return self._relationship_labels
+
+    @relationship_labels.setter
+    def relationship_labels(self, relationship_labels: dict[str, str]):
+        self._relationship_labels = relationship_labels
+        self.clear_label_cache()
+
+    @property
+    def object_labels(self) -> dict[str, str]:
+        """
+        URI to label of the objects.
+        """
+        return self._object_labels
+
+    @object_labels.setter
+    def object_labels(self, object_labels: dict[str, str]):
+        self._object_labels = object_labels
+        self.clear_label_cache()
+
+    @property
+    def rephrased(self) -> dict[str, str]:
+        """
+        URIs to rephrase/rename.
+        """
+        return self._rephrased
+
+    @rephrased.setter
+    def rephrased(self, rephrased: dict[str, str]):
+        self._rephrased = rephrased
+        self.clear_label_cache()
+
+    @property
+    def ignore(self) -> set[str]:
+        """
+        URIs to ignore.
+        """
+        return self._ignore_list
+
+    @ignore.setter
+    def ignore(self, ignore: set[str]):
+        self._ignore_list = ignore
+        self.clear_label_cache()
+
+    def clear_label_cache(self):
+        """
+        Remove all the memoized labels. Should be called if the label maps, the rephrased URIs or the ignored URIs are
+        changed in place.
+        """
+        self._label_cache.clear()
+
+    @property
+    def index(self) -> GraphIndex:
+        """
+        Compact index of the graph. It is built on first access and shared by everything that uses this vocabulary, or
+        is the graph of the vocabulary if it was built over an index.
+        """
+        if self._index is None:
+            self._index = GraphIndex.from_graph(self.graph)
+        return self._index
+
+    def _label_snapshot_path(self, cache_dir: str, fingerprint: Optional[str]) -> str:
+        """
+        The label maps only depend on the graph, on the imports merged into them and on how they are harvested, the
+        ignore and rephrase configuration is applied when looking labels up, so it is not part of the key. Hashing
+        every triple of a large graph takes longer than building its labels, so the graph is identified by the file it
+        was loaded from unless a fingerprint is given. The imports of the graph are identified by their files (see
+        `ImportResolver.fingerprint`) without loading them, so a snapshot taken without an import (offline, or with
+        imports disabled) is not loaded by a vocabulary that would merge it.
+        """
+        fingerprint = fingerprint or source_fingerprint(self.graph)
+        if fingerprint is None:
+            raise ValueError('A label snapshot requires a fingerprint when the graph was not loaded from a file')
+        resolver = self.import_resolver or ImportResolver()
+        imports = ImportResolver.imports_of(self.graph) if self._load_imports_enabled else []
+        key = hashlib.sha256('\n'.join((
+            f'labels-v{LABEL_SNAPSHOT_VERSION}',
+            f'{type(self).__module__}.{type(self).__qualname__}',
+            fingerprint,
+            f'imports-{self._load_imports_enabled}',
+            *(f'{iri} {resolver.fingerprint(iri)}' for iri in imports),
+        )).encode('utf-8')).hexdigest()
+        return str(Path(cache_dir) / f'vocabulary-{key}.sqlite')
+
+    def _load_label_snapshot(self, path: str) -> Optional[tuple[dict[str, str], dict[str, str]]]:
+        """
+        Load the label maps from a snapshot, unless one of the imports merged into them changed. The imports of the
+        imports are not part of the key, they are checked against the fingerprints recorded in the snapshot, so the
+        imports are only loaded when there is no snapshot.
+        :return: (relationship labels, object labels) or None.
+        """
+        imports = label_snapshot_imports(path)
+        if imports is None:
+            return None
+        resolver = self.import_resolver or ImportResolver()
+        changed = [iri for iri, fingerprint in imports.items() if resolver.fingerprint(iri) != fingerprint]
+        if changed:
+            logger.info(f'Not loading {path}, its imports changed: {", ".join(changed)}')
+            return None
+        return load_label_snapshot(path)
+
+    def _import_fingerprints(self) -> dict[str, str]:
+        """
+        :return: IRI to `ImportResolver.fingerprint` of every import reachable from the graph, including the imports
+        that could not be resolved.
+        """
+        imports = self._resolve_imports()
+        iris = set(ImportResolver.imports_of(self.graph)) if self._load_imports_enabled else set()
+        iris.update(imports)
+        for _, imported in imports.values():
+            iris.update(imported)
+        resolver = self.import_resolver or ImportResolver()
+        return {iri: resolver.fingerprint(iri) for iri in sorted(iris)}
+
     def should_ignore(self, uri: str | URIRef) -> bool:
         """
         Check if URI should be ignored or not.
@@ -99,7 +308,7 @@ class Vocabulary:
         :param default: Default value if not found.
         :return: string.
         """
-        return self._util_lookup(self.relationship_labels, val) or default
+        return self._timed_lookup(self.relationship_labels, val) or default
 
     def get_class_label(self, val, default=None) -> str:
         """
@@ -108,27 +317,33 @@ class Vocabulary:
         :param default: Default value if not found.
         :return: string.
         """
-        return self._util_lookup(self.object_labels, val) or default
+        return self._timed_lookup(self.object_labels, val) or default
+
+    def _timed_lookup(self, dictionary, val):
+        """
+        Look a label up, charging the time to the `label_lookup` stage of the timer set by `timed_label_lookups`.
+        """
+        timer = label_timer.get()
+        if timer is None:
+            return self._util_lookup(dictionary, val)
+        timer.start('label_lookup')
+        try:
+            return self._util_lookup(dictionary, val)
+        finally:
+            timer.stop()
 
     def _get_ontology_relationship_labels(self) -> dict[str, str]:
         """
         Returns a IRI (URI) to label dictionary.
         """
-        results = self.graph.query(self.RELATIONSHIP_QUERY)
         ontology_relations = {}
 
-        for result in tqdm(results, desc='Loading Ontology Relationship Labels'):
-            iri, label = result
-            iri_str = iri.toPython()
-            label_str = label.toPython()
-
-            # if the label is also the URI then try to parse it.
-            if label_str.startswith('http'):
-                label_str = self._from_uri_to_text(label_str)
-
-            label_str = re.sub('[^0-9a-zA-Z]+', ' ', label_str)
-
-            ontology_relations[iri_str] = label_str
+        for iri in tqdm(self.graph.predicates(unique=True), desc='Loading Ontology Relationship Labels'):
+            # like RELATIONSHIP_QUERY, the last label of a relationship wins, or its URI if it has none.
+            label = iri
+            for label in self.graph.objects(iri, RDFS.label):
+                pass
+            ontology_relations[iri.toPython()] = self._relationship_label(label.toPython())
 
         return ontology_relations
 
@@ -136,27 +351,107 @@ class Vocabulary:
         """
         Returns a IRI (URI) to label dictionary.
         """
-        results = self.graph.query(self.OBJECTS_QUERY)
+        # every labeled subject, then the classes without a label, named by their URI.
+        labeled = self.graph.subject_objects(RDFS.label)
+        unlabeled = ((iri, iri) for iri in self.graph.subjects(RDF.type, OWL.Class, unique=True)
+                     if (iri, RDFS.label, None) not in self.graph)
         object_labels = {}
-        for result in tqdm(results, desc='Loading Ontology Object Labels'):
-            iri, label = result
+        for iri, label in tqdm(itertools.chain(labeled, unlabeled), desc='Loading Ontology Object Labels'):
             iri_str = iri.toPython()
-            label_str = label.toPython()
+            label_str = self._object_label(iri_str, label.toPython())
+            if label_str is not None:
+                object_labels[iri_str] = label_str
 
-            if iri_str == label_str and not label_str.startswith('http'):
-                # skip BNodes
-                continue
+        return object_labels
 
-            # if the label is also the URI then try to parse it.
-            if label_str.startswith('http'):
-                label_str = self._from_uri_to_text(label_str)
-            # Convert label to lower case snake case and remove spaces.
-            label_str = self._camel_to_snake(label_str)
-            label_str = re.sub('[^0-9a-zA-Z]+', ' ', label_str)
+    def _relationship_label(self, label_str: str) -> str:
+        """
+        Normalize the label of a relationship.
+        """
+        # if the label is also the URI then try to parse it.
+        if label_str.startswith('http'):
+            label_str = self._from_uri_to_text(label_str)
 
-            object_labels[iri_str] = label_str
+        return _NON_ALPHANUMERIC.sub(' ', label_str)
 
-        return object_labels
+    def _object_label(self, iri_str: str, label_str: str) -> Optional[str]:
+        """
+        Normalize the label of an object.
+        :return: The label, or None if the object should not be labeled.
+        """
+        if self._is_unlabeled(iri_str, label_str):
+            return None
+
+        # if the label is also the URI then try to parse it.
+        if label_str.startswith('http'):
+            label_str = self._from_uri_to_text(label_str)
+        # Convert label to lower case snake case and remove spaces.
+        label_str = self._camel_to_snake(label_str)
+        return _NON_ALPHANUMERIC.sub(' ', label_str)
+
+    def _resolve_object_term(self, iri: URIRef | BNode):
+        """
+        :return: The label of an object in the eager map, before it is normalized, or None.
+        """
+        labels = list(self.graph.objects(iri, RDFS.label))
+        if len(labels) > 1:
+            # the eager map keeps the label seen last among all the labels of the graph, which is not necessarily the
+            # last label of the object. Objects with several labels are rare, so the order is only read if needed.
+            if self._last_labels is None:
+                self._last_labels = {
+                    subject: label for subject, label in self.graph.subject_objects(RDFS.label)
+                    if not self._is_unlabeled(subject.toPython(), label.toPython())
+                }
+            return self._last_labels.get(iri)
+        if labels:
+            return labels[0]
+        if (iri, RDF.type, OWL.Class) in self.graph:
+            return iri
+        return None
+
+    @staticmethod
+    def _is_unlabeled(iri_str: str, label_str: str) -> bool:
+        # skip BNodes
+        return iri_str == label_str and not label_str.startswith('http')
+
+    def _resolve_relationship_label(self, iri_str: str) -> Optional[str]:
+        """
+        Resolve the label of a relationship in lazy mode, the way `_get_ontology_relationship_labels` would.
+        """
+        # the labels of the imports take precedence, as in the eager maps.
+        for vocab in reversed(self._imports):
+            if (label_str := vocab.relationship_labels.get(iri_str)) is not None:
+                return label_str
+
+        # the eager maps are keyed by plain strings, so other terms (e.g. blank nodes) are never found in them.
+        if type(iri_str) is not str:
+            return None
+        iri = URIRef(iri_str)
+        if (None, iri, None) not in self.graph:
+            return None
+
+        label = iri
+        for label in self.graph.objects(iri, RDFS.label):
+            pass
+        return self._relationship_label(label.toPython())
+
+    def _resolve_object_label(self, iri_str: str) -> Optional[str]:
+        """
+        Resolve the label of an object in lazy mode, the way `_get_ontology_object_labels` would.
+        """
+        for vocab in reversed(self._imports):
+            if (label_str := vocab.object_labels.get(iri_str)) is not None:
+                return label_str
+
+        if type(iri_str) is not str:
+            return None
+        # the eager map is keyed by the string of the labeled blank nodes as well.
+        label = self._resolve_object_term(URIRef(iri_str))
+        if label is None:
+            label = self._resolve_object_term(BNode(iri_str))
+        if label is None:
+            return None
+        return self._object_label(iri_str, label.toPython())
 
     def _util_lookup(self, dictionary, val):
         """
@@ -177,6 +472,36 @@ class Vocabulary:
         if not isinstance(val, str):
             return None
 
+        if self.label_cache_size <= 0:
+            return self._uncached_lookup(dictionary, val)
+
+        if dictionary is self._object_labels:
+            name = 'object'
+        elif dictionary is self._relationship_labels:
+            name = 'relationship'
+        else:
+            # only the label maps of the vocabulary are memoized.
+            return self._uncached_lookup(dictionary, val)
+
+        cache = self._label_cache.get(name)
+        if cache is None:
+            cache = self._label_cache[name] = OrderedDict()
+        try:
+            result = cache[val]
+        except KeyError:
+            self.label_cache_misses += 1
+            result = cache[val] = self._uncached_lookup(dictionary, val)
+            if len(cache) > self.label_cache_size:
+                cache.popitem(last=False)
+        else:
+            self.label_cache_hits += 1
+            cache.move_to_end(val)
+        return result
+
+    def _uncached_lookup(self, dictionary, val: str):
+        """
+        Lookup of `_util_lookup`, without the memo.
+        """
         if val in self._ignore_list:
             return self.__class__.IGNORE_VALUE
 
@@ -210,18 +535,51 @@ class Vocabulary:
         Convert camelCase into snake_case.
         e.g. MyPhrase -> my_phrase
         """
-        name = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', name)
-        return re.sub('([a-z0-9])([A-Z])', r'\1_\2', name).lower()
+        name = _CAMEL_WORD.sub(r'\1_\2', name)
+        return _CAMEL_BOUNDARY.sub(r'\1_\2', name).lower()
+
+    def _resolve_imports(self) -> dict[str, tuple[Graph, list[str]]]:
+        """
+        :return: The imports reachable from the graph, see `ImportResolver.closure`. They are resolved once.
+        """
+        if self._import_closure is None:
+            if self._load_imports_enabled:
+                self._import_closure = (self.import_resolver or ImportResolver()).closure(self.graph)
+            else:
+                self._import_closure = {}
+        return self._import_closure
 
     def _load_imports(self):
         """
-        Loads concepts from imports. This is done by creating a new instance of Vocabulary, using the imported graph.
+        Loads concepts from imports, including the imports of the imports. A Vocabulary is created for every imported
+        graph, and its labels are merged after the labels of the graphs that import it, so they take precedence.
         """
-        owl_imports = {o[0].toPython() for o in self.graph.query("SELECT DISTINCT ?o WHERE { ?s owl:imports ?o }")}
-        for owl_import in owl_imports:
-            logging.info(f'LOADING IMPORT: {owl_import}')
-            graph = Graph()
-            graph.parse(owl_import, format='xml')
-            sub_vocab = self.__class__(graph)
-            self.object_labels.update(sub_vocab.object_labels)
-            self.relationship_labels.update(sub_vocab.relationship_labels)
+        imports = self._resolve_imports()
+        if not imports:
+            return
+        vocabularies = {
+            iri: self.__class__(graph, lazy=self._lazy, load_imports=False) for iri, (graph, _) in imports.items()
+        }
+
+        # a single depth-first walk from the ontology: in reverse post-order, every import comes after the imports that
+        # import it. An import that closes a cycle is not followed.
+        visited = set()
+        post_order = []
+
+        def visit(iri: str):
+            visited.add(iri)
+            for imported in imports[iri][1]:
+                if imported in imports and imported not in visited:
+                    visit(imported)
+            post_order.append(iri)
+
+        for iri in ImportResolver.imports_of(self.graph):
+            if iri in imports and iri not in visited:
+                visit(iri)
+        for iri in reversed(post_order):
+            sub_vocab = vocabularies[iri]
+            if self._lazy:
+                self._imports.append(sub_vocab)
+            else:
+                self.object_labels.update(sub_vocab.object_labels)
+                self.relationship_labels.update(sub_vocab.relationship_labels)